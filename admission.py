@@ -0,0 +1,147 @@
+"""Admission control: per-client token buckets and a concurrency cap.
+
+Routes are grouped into classes (``auth``, ``write``, ``heavy`` ...) and each
+class has its own bucket per client: ``capacity`` requests may be made in a
+burst, refilled evenly over ``period`` seconds.  Buckets live in a small
+SQLite file next to the app database so that every worker process sees the
+same counts; ``MemoryBucketStore`` is used for single-process runs.
+
+Load is shed with 503 in two ways, both per worker process.  A request
+that waited in the server's queue for longer than a limit is rejected, as
+read from the ``X-Request-Start`` header a front-end proxy sets on arrival
+(``queue_time``); this is what notices a backlog under gunicorn, where
+requests wait for a free thread before the app sees them.
+``ConcurrencyLimiter`` caps the requests a worker serves at once, and of
+those the ``heavy`` ones.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+
+def refill(tokens, updated_at, capacity, rate, cost, now):
+    """Return ``(tokens_left, allowed, retry_after)`` for one bucket take."""
+    tokens = min(capacity, tokens + max(now - updated_at, 0) * rate)
+    if tokens >= cost:
+        return tokens - cost, True, 0
+    return tokens, False, math.ceil((cost - tokens) / rate)
+
+
+class MemoryBucketStore:
+    """Token buckets held in this process only."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, capacity, rate, cost=1):
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens, allowed, retry_after = refill(tokens, updated_at, capacity, rate, cost, now)
+            self._buckets[key] = (tokens, now)
+        return allowed, retry_after
+
+
+class SQLiteBucketStore:
+    """Token buckets shared by every worker through a SQLite file.
+
+    The file is separate from the application database so that rate-limit
+    bookkeeping never waits on (or holds) the main database's write lock.
+    """
+
+    PRUNE_EVERY = 1000
+    PRUNE_AGE = 3600
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+        with closing(sqlite3.connect(path)) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS token_bucket ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+
+    def _connection(self):
+        # One connection per thread, reopened after fork().
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=0.25, isolation_level=None)
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key, capacity, rate, cost=1):
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated_at FROM token_bucket WHERE key = ?', (key,)
+            ).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            tokens, allowed, retry_after = refill(tokens, updated_at, capacity, rate, cost, now)
+            conn.execute(
+                'INSERT INTO token_bucket (key, tokens, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                (key, tokens, now),
+            )
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY == 0:
+                # An idle bucket refills completely long before PRUNE_AGE, so
+                # dropping it is the same as keeping a full one.
+                conn.execute('DELETE FROM token_bucket WHERE updated_at < ?', (now - self.PRUNE_AGE,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, retry_after
+
+
+def queue_time(header, now=None):
+    """Seconds since ``X-Request-Start``, or None when it is missing or invalid.
+
+    Accepts ``t=<timestamp>`` or a bare timestamp in seconds (nginx
+    ``$msec``), milliseconds or microseconds.
+    """
+    if not header:
+        return None
+    try:
+        started = float(header.strip().removeprefix('t='))
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max((now or time.time()) - started, 0)
+
+
+class ConcurrencyLimiter:
+    """Non-blocking caps on in-flight requests in this worker process."""
+
+    def __init__(self, max_total, max_heavy):
+        self._total = threading.BoundedSemaphore(max_total)
+        self._heavy = threading.BoundedSemaphore(max_heavy)
+
+    def acquire(self, heavy=False):
+        """Return a release callback, or None when the worker is saturated."""
+        if not self._total.acquire(blocking=False):
+            return None
+        if heavy and not self._heavy.acquire(blocking=False):
+            self._total.release()
+            return None
+
+        def release():
+            if heavy:
+                self._heavy.release()
+            self._total.release()
+
+        return release
@@ -1,11 +1,32 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+import hashlib
+import io
+import json
+import pstats
+import random
+import sqlite3
+import string
+import sys
+import threading
+import time
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response, g, abort, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from werkzeug.utils import secure_filename, safe_join
+from werkzeug.middleware.proxy_fix import ProxyFix
 import datetime
+import click
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.schema import CreateIndex
+from forum_events import ForumEventBus, SQLiteNotifier, format_sse
+from admission import ConcurrencyLimiter, MemoryBucketStore, SQLiteBucketStore, queue_time
+from view_counters import ViewCounterBuffer
+from price_analytics import summarize_by_category, summarize_prices
+from profiling import MODES as PROFILE_MODES, ProfileStore
+import db_maintenance
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here-change-in-production'
@@ -14,6 +35,82 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
 
+# Live forum updates (Server-Sent Events)
+app.config['FORUM_EVENTS_HEARTBEAT'] = 15  # seconds between keep-alive comments
+app.config['FORUM_EVENTS_MAX_STREAM'] = 120  # seconds before a stream asks the browser to reconnect
+# Open streams per worker process. Each one occupies a worker thread for its
+# whole lifetime (see gunicorn.conf.py); further streams are refused with 503
+# and the browser tries again after FORUM_EVENTS_BUSY_RETRY seconds.
+app.config['FORUM_EVENTS_MAX_STREAMS'] = int(os.environ.get('FORUM_EVENTS_MAX_STREAMS', 8))
+app.config['FORUM_EVENTS_BUSY_RETRY'] = 30
+app.config['FORUM_EVENTS_RESUME_LIMIT'] = 100  # posts replayed for a Last-Event-ID resume
+# Set to 'sqlite' when running several worker processes so events reach every worker
+app.config['FORUM_EVENTS_FANOUT'] = os.environ.get('FORUM_EVENTS_FANOUT', 'local')
+
+# Forum archive: threads without activity for this long move to cold tables
+app.config['FORUM_ARCHIVE_AFTER_DAYS'] = 365
+app.config['FORUM_ARCHIVE_BATCH_SIZE'] = 200
+
+# View counters are buffered in memory and written in one batch every
+# VIEW_COUNTER_FLUSH_SECONDS or VIEW_COUNTER_FLUSH_EVENTS views, whichever comes first
+app.config['VIEW_COUNTER_FLUSH_SECONDS'] = 10
+app.config['VIEW_COUNTER_FLUSH_EVENTS'] = 500
+
+# Admission control: route class -> (burst size, seconds to refill it) per client
+app.config['RATE_LIMITS'] = {
+    'auth': (10, 300),
+    'write': (30, 60),
+    'heavy': (60, 60),
+    # Sign-in and registration attempts naming one email, from all clients
+    # together. Well above 'auth', so one client cannot lock the owner out.
+    'auth_account': (100, 300),
+}
+# 'sqlite' shares buckets between worker processes; 'memory' keeps them per process
+app.config['RATE_LIMIT_STORAGE'] = os.environ.get('RATE_LIMIT_STORAGE', 'sqlite')
+# Load shedding. Every limit below is per worker process, not for the whole
+# site: with N workers the site serves up to N times as many requests.
+# Requests that waited longer than this many seconds between reaching the
+# front-end proxy and reaching the app get 503. The proxy must stamp arrival,
+# e.g. nginx `proxy_set_header X-Request-Start "t=${msec}";`; without the
+# header nothing is shed this way. Under gunicorn this is the limit that
+# fires, because excess requests queue for a thread before the app sees them.
+app.config['ADMISSION_MAX_QUEUE_WAIT'] = float(os.environ.get('ADMISSION_MAX_QUEUE_WAIT', 5))
+# In-flight request caps; excess requests get 503 at once. gunicorn.conf.py
+# derives both from its thread count. Its threads already bound the total, so
+# that cap only matters for servers without a fixed pool; the heavy cap is one
+# below the request threads, so a burst of expensive pages always leaves a
+# thread for everything else.
+app.config['ADMISSION_MAX_CONCURRENT'] = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 12))
+app.config['ADMISSION_MAX_HEAVY'] = int(os.environ.get('ADMISSION_MAX_HEAVY', 3))
+
+# Consultant ratings are ranked by a Bayesian average: every consultant starts
+# with PRIOR_WEIGHT virtual reviews of PRIOR_MEAN stars, so a single 5-star
+# review does not outrank a long record of good ones.
+# Run `flask recompute-ratings` after changing these.
+app.config['CONSULTANT_RATING_PRIOR_MEAN'] = 3.5
+app.config['CONSULTANT_RATING_PRIOR_WEIGHT'] = 5
+
+# Request profiling (off unless PROFILING_ENABLED=1; nothing is hooked in when off).
+# Admins profile a request by sending "X-Profile: sampling" or "X-Profile: cprofile";
+# PROFILING_SAMPLE_RATE additionally profiles that fraction of all requests.
+app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', '0') == '1'
+app.config['PROFILING_SAMPLE_RATE'] = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+app.config['PROFILING_SAMPLE_MODE'] = os.environ.get('PROFILING_SAMPLE_MODE', 'sampling')
+app.config['PROFILING_SAMPLE_INTERVAL'] = 0.005  # seconds between stack samples
+app.config['PROFILING_MAX_FILES'] = 200
+app.config['PROFILING_DIR'] = os.environ.get('PROFILING_DIR')  # default: instance/profiles
+
+# SQLite maintenance, see the backup-db, vacuum-db and maintain-db commands
+app.config['BACKUP_DIR'] = os.environ.get('BACKUP_DIR')  # default: instance/backups
+app.config['BACKUP_KEEP'] = 7  # newest backups kept
+app.config['BACKUP_PAGES_PER_STEP'] = 256  # pages copied while holding the read lock
+app.config['BACKUP_STEP_SLEEP'] = 0.01  # seconds writers get between steps
+app.config['VACUUM_PAGES_PER_RUN'] = 2000  # free pages released per scheduled vacuum
+
+# Number of reverse proxies in front of the app, so rate limits see real client IPs
+if int(os.environ.get('PROXY_FIX_X_FOR', 0)):
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.environ['PROXY_FIX_X_FOR']))
+
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
@@ -31,7 +128,15 @@ class User(UserMixin, db.Model):
     profile_picture = db.Column(db.String(200))
     is_admin = db.Column(db.Boolean, default=False)
     is_consultant = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # Overrides UserMixin.is_active: deactivated users cannot log in
+    is_active = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+    
+    # Case-insensitive prefix search in the user admin, see filtered_users_query()
+    __table_args__ = (
+        db.Index('ix_user_username_lower', db.func.lower(username)),
+        db.Index('ix_user_email_lower', db.func.lower(email)),
+    )
     
     # Relationships
     threads = db.relationship('ForumThread', backref='author', lazy=True, foreign_keys='ForumThread.user_id')
@@ -55,7 +160,7 @@ class ForumThread(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey('forum_category.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
     
     # Relationships
     posts = db.relationship('ForumPost', backref='thread', lazy=True, cascade='all, delete-orphan')
@@ -63,10 +168,44 @@ class ForumThread(db.Model):
 class ForumPost(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
-    thread_id = db.Column(db.Integer, db.ForeignKey('forum_thread.id'), nullable=False)
+    thread_id = db.Column(db.Integer, db.ForeignKey('forum_thread.id'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
+# Cold storage for inactive forum threads, see archive_forum_threads().
+# Rows keep their original ids so links to archived threads keep working.
+class ArchivedForumThread(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(200), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('forum_category.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    
+    # Relationships
+    author = db.relationship('User')
+    category = db.relationship('ForumCategory')
+    posts = db.relationship('ArchivedForumPost', backref='thread', lazy=True, cascade='all, delete-orphan')
+
+class ArchivedForumPost(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    content = db.Column(db.Text, nullable=False)
+    thread_id = db.Column(db.Integer, db.ForeignKey('archived_forum_thread.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime)
+    
+    author = db.relationship('User')
+
+# Aggregated page views, written in batches by the view counter buffer
+class ViewCount(db.Model):
+    entity_type = db.Column(db.String(20), primary_key=True)  # product, blog_post, forum_thread
+    entity_id = db.Column(db.Integer, primary_key=True)
+    views = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_view_count_type_views', 'entity_type', 'views'),)
+
 class BlogPost(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -77,6 +216,9 @@ class BlogPost(db.Model):
     image_url = db.Column(db.String(200))
     approved = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    
+    # Partial index: only rows waiting in the moderation queue are indexed
+    __table_args__ = (db.Index('ix_blog_post_pending', 'created_at', sqlite_where=approved == False),)
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -90,6 +232,39 @@ class Product(db.Model):
     approved = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    
+    __table_args__ = (
+        # Lets price rollups read one category's prices in order from the index alone
+        db.Index('ix_product_category_approved_price', 'category', 'approved', 'price'),
+        db.Index('ix_product_pending', 'created_at', sqlite_where=approved == False),
+    )
+
+# Daily market price summary per product category, see refresh_price_rollups()
+class PriceRollup(db.Model):
+    category = db.Column(db.String(100), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    min_price = db.Column(db.Float)
+    max_price = db.Column(db.Float)
+    mean_price = db.Column(db.Float)
+    median_price = db.Column(db.Float)
+    p25_price = db.Column(db.Float)
+    p75_price = db.Column(db.Float)
+    p90_price = db.Column(db.Float)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'count': self.count,
+            'min': self.min_price,
+            'max': self.max_price,
+            'mean': self.mean_price,
+            'median': self.median_price,
+            'p25': self.p25_price,
+            'p75': self.p75_price,
+            'p90': self.p90_price,
+        }
 
 class Consultant(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -100,10 +275,109 @@ class Consultant(db.Model):
     bio = db.Column(db.Text)
     approved = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # Review aggregates, kept up to date by apply_rating_change() so that
+    # listings never have to aggregate reviews.
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_score = db.Column(db.Float, nullable=False, default=app.config['CONSULTANT_RATING_PRIOR_MEAN'],
+                             server_default=db.text(repr(float(app.config['CONSULTANT_RATING_PRIOR_MEAN']))))
+    
+    __table_args__ = (
+        db.Index('ix_consultant_pending', 'created_at', sqlite_where=approved == False),
+        db.Index('ix_consultant_rating', 'rating_score', 'id'),
+    )
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
+class Review(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    consultant_id = db.Column(db.Integer, db.ForeignKey('consultant.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    rating = db.Column(db.Integer, nullable=False)  # 1-5 stars
+    comment = db.Column(db.Text)
+    service_type = db.Column(db.String(50))  # video, phone, visit
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    consultant = db.relationship('Consultant', backref=db.backref('reviews', lazy='dynamic'))
+    user = db.relationship('User', backref=db.backref('reviews', lazy=True))
+
+    # One review per client and consultant; writing again edits it.
+    __table_args__ = (
+        db.UniqueConstraint('consultant_id', 'user_id', name='uq_review_consultant_user'),
+        db.Index('ix_review_consultant_created', 'consultant_id', 'created_at'),
+    )
+
+forum_bus = ForumEventBus()
+
+forum_stream_slots = None
+
+def get_forum_stream_slots():
+    global forum_stream_slots
+    if forum_stream_slots is None:
+        forum_stream_slots = threading.BoundedSemaphore(app.config['FORUM_EVENTS_MAX_STREAMS'])
+    return forum_stream_slots
+
+def get_forum_bus():
+    # The notifier thread is started lazily so that it is created in the
+    # worker process that serves requests, not in a parent that forks.
+    if app.config['FORUM_EVENTS_FANOUT'] == 'sqlite' and forum_bus.notifier is None:
+        forum_bus.attach_notifier(SQLiteNotifier(db.engine.url.database))
+    return forum_bus
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user = User.query.get(int(user_id))
+    # Sessions of deactivated users end on their next request.
+    return user if user and user.is_active else None
+
+# Page view counters
+# Rows per INSERT: 4 bound parameters each, under the 999 per statement that
+# SQLite allowed before 3.32.
+VIEW_COUNTER_BATCH_SIZE = 200
+
+def flush_view_counts(rows):
+    now = datetime.datetime.utcnow()
+    # Runs on the flush thread, outside any request. One transaction, but
+    # several statements, so a large backlog stays under SQLite's limit on
+    # bound parameters per statement.
+    with app.app_context():
+        with db.engine.begin() as conn:
+            for start in range(0, len(rows), VIEW_COUNTER_BATCH_SIZE):
+                statement = sqlite_insert(ViewCount).values([
+                    {'entity_type': entity_type, 'entity_id': entity_id, 'views': views, 'updated_at': now}
+                    for entity_type, entity_id, views in rows[start:start + VIEW_COUNTER_BATCH_SIZE]
+                ])
+                statement = statement.on_conflict_do_update(
+                    index_elements=[ViewCount.entity_type, ViewCount.entity_id],
+                    set_={'views': ViewCount.views + statement.excluded.views,
+                          'updated_at': statement.excluded.updated_at}
+                )
+                conn.execute(statement)
+
+view_counter = ViewCounterBuffer(flush_view_counts,
+                                 interval=app.config['VIEW_COUNTER_FLUSH_SECONDS'],
+                                 max_events=app.config['VIEW_COUNTER_FLUSH_EVENTS'])
+
+def view_counts(entity_type, entity_ids):
+    if not entity_ids:
+        return {}
+    rows = db.session.query(ViewCount.entity_id, ViewCount.views)\
+                     .filter(ViewCount.entity_type == entity_type, ViewCount.entity_id.in_(entity_ids))\
+                     .all()
+    return dict(rows)
+
+def most_viewed(entity_type, model, limit=5):
+    # Walks the (entity_type, views) index from the top; the join skips
+    # counters left behind by deleted, rejected or archived entities before
+    # the limit applies. Returns [(entity, views)].
+    return db.session.query(model, ViewCount.views)\
+                     .join(ViewCount, db.and_(ViewCount.entity_type == entity_type,
+                                              ViewCount.entity_id == model.id))\
+                     .order_by(ViewCount.views.desc())\
+                     .limit(limit)\
+                     .all()
 
 # Custom filters
 @app.template_filter('time_ago')
@@ -131,6 +405,147 @@ def is_new_filter(created_at, days=7):
         return False
     return (datetime.datetime.now() - created_at).days <= days
 
+# Admission control
+bucket_store = None
+concurrency_limiter = None
+
+def rate_limit(route_class, methods=None):
+    # Tags a view with its rate-limit class; checked in admit_request().
+    def decorator(view):
+        view.rate_limit_class = route_class
+        view.rate_limit_methods = methods
+        return view
+    return decorator
+
+def get_bucket_store():
+    global bucket_store
+    if bucket_store is None:
+        if app.config['RATE_LIMIT_STORAGE'] == 'sqlite':
+            os.makedirs(app.instance_path, exist_ok=True)
+            bucket_store = SQLiteBucketStore(os.path.join(app.instance_path, 'ratelimit.db'))
+        else:
+            bucket_store = MemoryBucketStore()
+    return bucket_store
+
+def get_concurrency_limiter():
+    global concurrency_limiter
+    if concurrency_limiter is None:
+        concurrency_limiter = ConcurrencyLimiter(app.config['ADMISSION_MAX_CONCURRENT'],
+                                                 app.config['ADMISSION_MAX_HEAVY'])
+    return concurrency_limiter
+
+def rate_limit_keys(route_class):
+    # (bucket key, RATE_LIMITS entry) pairs charged for this request
+    if route_class != 'auth' and current_user.is_authenticated:
+        # Many farmers share one carrier IP, so signed-in users get their own budget.
+        keys = [(f'{route_class}:user:{current_user.id}', route_class)]
+    else:
+        keys = [(f'{route_class}:ip:{request.remote_addr}', route_class)]
+    if route_class == 'auth' and request.form.get('email'):
+        # Also throttle password guessing spread over many IPs against one account.
+        keys.append((f'auth:email:{request.form["email"].strip().lower()}', 'auth_account'))
+    return keys
+
+def reject_request(status, retry_after, message):
+    response = Response(message, status=status, mimetype='text/plain')
+    response.headers['Retry-After'] = str(max(int(retry_after), 1))
+    return response
+
+@app.before_request
+def admit_request():
+    if request.endpoint in (None, 'static', 'healthz', 'readyz'):
+        return None
+    view = app.view_functions.get(request.endpoint)
+    route_class = getattr(view, 'rate_limit_class', None)
+    methods = getattr(view, 'rate_limit_methods', None)
+    if route_class and methods and request.method not in methods:
+        route_class = None
+    if route_class is None and request.method in ('POST', 'PUT', 'PATCH', 'DELETE'):
+        route_class = 'write'
+
+    # The client has most likely given up by now; answering quickly drains
+    # the queue instead of spending a thread on a page nobody will see.
+    waited = queue_time(request.headers.get('X-Request-Start'))
+    if waited is not None and waited > app.config['ADMISSION_MAX_QUEUE_WAIT']:
+        return reject_request(503, 1, 'The server is busy. Please try again in a moment.')
+
+    if route_class in app.config['RATE_LIMITS']:
+        for key, limit in rate_limit_keys(route_class):
+            capacity, period = app.config['RATE_LIMITS'][limit]
+            try:
+                allowed, retry_after = get_bucket_store().take(key, capacity, capacity / period)
+            except sqlite3.Error as e:
+                # Fail open: a busy limiter must not take the site down with it.
+                app.logger.warning(f"Rate limiter unavailable: {e}")
+                break
+            if not allowed:
+                return reject_request(429, retry_after, 'Too many requests. Please slow down and try again shortly.')
+
+    release = get_concurrency_limiter().acquire(heavy=route_class == 'heavy')
+    if release is None:
+        return reject_request(503, 1, 'The server is busy. Please try again in a moment.')
+    g.admission_release = release
+
+@app.after_request
+def hold_admission(response):
+    # A streamed body is sent after the request has been torn down; keep its
+    # slot until the server closes it, for as long as it occupies a thread.
+    if response.is_streamed:
+        release = g.pop('admission_release', None)
+        if release is not None:
+            response.call_on_close(release)
+    return response
+
+@app.teardown_request
+def release_admission(exc):
+    release = g.pop('admission_release', None)
+    if release is not None:
+        release()
+
+# Request profiling
+# Hooks are registered only when profiling is enabled, so that a disabled
+# profiler costs nothing at all per request.
+profile_store = None
+
+def get_profile_store():
+    global profile_store
+    if profile_store is None:
+        directory = app.config['PROFILING_DIR'] or os.path.join(app.instance_path, 'profiles')
+        profile_store = ProfileStore(directory, max_files=app.config['PROFILING_MAX_FILES'],
+                                     sample_interval=app.config['PROFILING_SAMPLE_INTERVAL'])
+    return profile_store
+
+def start_profiling():
+    mode = request.headers.get('X-Profile')
+    if mode:
+        # Only admins may switch the profiler on; loading the user costs a
+        # query, so it is only done for requests that ask.
+        if mode not in PROFILE_MODES or not (current_user.is_authenticated and current_user.is_admin):
+            return None
+    elif app.config['PROFILING_SAMPLE_RATE'] and random.random() < app.config['PROFILING_SAMPLE_RATE']:
+        mode = app.config['PROFILING_SAMPLE_MODE']
+    else:
+        return None
+    g.profile_capture = get_profile_store().start(mode)
+
+def save_profile(response):
+    capture = g.pop('profile_capture', None)
+    if capture is not None:
+        name = capture.save(f"{request.method}-{request.endpoint or 'unknown'}")
+        response.headers['X-Profile-Id'] = name
+    return response
+
+def discard_profile(exc):
+    # Requests that failed before after_request still release the profiler.
+    capture = g.pop('profile_capture', None)
+    if capture is not None:
+        capture.stop()
+
+if app.config['PROFILING_ENABLED']:
+    app.before_request(start_profiling)
+    app.after_request(save_profile)
+    app.teardown_request(discard_profile)
+
 # Routes
 @app.route('/')
 def index():
@@ -141,6 +556,7 @@ def index():
                          latest_products=latest_products)
 
 @app.route('/register', methods=['GET', 'POST'])
+@rate_limit('auth', methods=('POST',))
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -178,6 +594,7 @@ def register():
     return render_template('auth/register.html')
 
 @app.route('/login', methods=['GET', 'POST'])
+@rate_limit('auth', methods=('POST',))
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
@@ -185,6 +602,9 @@ def login():
         user = User.query.filter_by(email=email).first()
         
         if user and check_password_hash(user.password_hash, password):
+            if not user.is_active:
+                flash('Your account has been deactivated. Please contact support.', 'danger')
+                return render_template('auth/login.html')
             login_user(user)
             next_page = request.args.get('next')
             flash('Login successful!', 'success')
@@ -220,18 +640,31 @@ def forum_category(category_id):
                               .options(joinedload(ForumThread.author))\
                               .order_by(ForumThread.created_at.desc())\
                               .all()
-    return render_template('forum/threads.html', category=category, threads=threads)
+    thread_views = view_counts('forum_thread', [t.id for t in threads])
+    return render_template('forum/threads.html', category=category, threads=threads, thread_views=thread_views)
 
 @app.route('/forum/thread/<int:thread_id>')
 def forum_thread(thread_id):
     # Use eager loading for author information
     thread = ForumThread.query.options(joinedload(ForumThread.author))\
-                             .get_or_404(thread_id)
+                             .filter_by(id=thread_id)\
+                             .first()
+    if thread is None:
+        # Fall back to the archive so old links keep working.
+        thread = ArchivedForumThread.query.options(joinedload(ArchivedForumThread.author))\
+                                         .get_or_404(thread_id)
+        view_counter.increment('forum_thread', thread_id)
+        posts = ArchivedForumPost.query.filter_by(thread_id=thread_id)\
+                                      .options(joinedload(ArchivedForumPost.author))\
+                                      .order_by(ArchivedForumPost.created_at)\
+                                      .all()
+        return render_template('forum/post.html', thread=thread, posts=posts, archived=True)
+    view_counter.increment('forum_thread', thread_id)
     posts = ForumPost.query.filter_by(thread_id=thread_id)\
                           .options(joinedload(ForumPost.author))\
                           .order_by(ForumPost.created_at)\
                           .all()
-    return render_template('forum/post.html', thread=thread, posts=posts)
+    return render_template('forum/post.html', thread=thread, posts=posts, archived=False)
 
 @app.route('/forum/create_thread/<int:category_id>', methods=['POST'])
 @login_required
@@ -263,6 +696,7 @@ def create_thread(category_id):
     )
     db.session.add(post)
     db.session.commit()
+    publish_forum_post(thread, post, 'thread')
     
     flash('Thread created successfully!', 'success')
     return redirect(url_for('forum_thread', thread_id=thread.id))
@@ -270,13 +704,19 @@ def create_thread(category_id):
 @app.route('/forum/thread/<int:thread_id>/reply', methods=['POST'])
 @login_required
 def post_reply(thread_id):
-    thread = ForumThread.query.get_or_404(thread_id)
     content = request.form.get('content')
     
     if not content or not content.strip():
         flash('Reply content cannot be empty!', 'danger')
         return redirect(url_for('forum_thread', thread_id=thread_id))
     
+    thread = ForumThread.query.get(thread_id)
+    if thread is None:
+        # Replying to an archived thread brings it back to the hot tables.
+        thread = restore_forum_thread(thread_id)
+        if thread is None:
+            abort(404)
+    
     post = ForumPost(
         content=content.strip(),
         thread_id=thread_id,
@@ -288,12 +728,233 @@ def post_reply(thread_id):
     
     db.session.add(post)
     db.session.commit()
+    publish_forum_post(thread, post, 'reply')
     
     flash('Reply posted successfully!', 'success')
     return redirect(url_for('forum_thread', thread_id=thread_id))
 
+# Live forum updates
+def forum_post_event(thread, post, kind):
+    return {
+        'id': post.id,
+        'kind': kind,
+        'thread_id': thread.id,
+        'thread_title': thread.title,
+        'category_id': thread.category_id,
+        'author': post.author.username if post.author else 'Unknown User',
+        'author_profession': post.author.profession if post.author and post.author.profession else 'Member',
+        'content': post.content,
+        'created_at': post.created_at.isoformat() if post.created_at else None,
+        'url': url_for('forum_thread', thread_id=thread.id),
+    }
+
+def publish_forum_post(thread, post, kind):
+    # Called after commit so that subscribers never see a post that could
+    # still be rolled back, and so that post.id is the final event id.
+    get_forum_bus().publish(
+        [f'thread:{thread.id}', f'category:{thread.category_id}'],
+        post.id, kind, forum_post_event(thread, post, kind)
+    )
+
+def last_event_id():
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+def forum_event_stream(bus, subscription, backlog):
+    heartbeat = app.config['FORUM_EVENTS_HEARTBEAT']
+    deadline = time.monotonic() + app.config['FORUM_EVENTS_MAX_STREAM']
+
+    def generate():
+        yield format_sse(retry=3000, comment='connected')
+        for event in backlog:
+            if subscription.accept(event['id']):
+                yield format_sse(event['data'], event=event['type'], event_id=subscription.newest_id)
+        while time.monotonic() < deadline and not subscription.overflowed:
+            event = subscription.get(timeout=heartbeat)
+            if event is None:
+                yield format_sse(comment='heartbeat')
+            else:
+                # Not event['id']: an older post arriving late must not move
+                # the browser's Last-Event-ID back to before newer ones.
+                yield format_sse(event['data'], event=event['type'], event_id=subscription.newest_id)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def open_forum_stream(channels, load_backlog):
+    # Streams hold a worker thread until they end, so each worker serves at
+    # most FORUM_EVENTS_MAX_STREAMS of them and refuses the rest up front.
+    slots = get_forum_stream_slots()
+    if not slots.acquire(blocking=False):
+        return reject_request(503, app.config['FORUM_EVENTS_BUSY_RETRY'],
+                              'Too many live connections. Please try again shortly.')
+    bus = get_forum_bus()
+    subscription = None
+    try:
+        last_id = last_event_id()
+        # Subscribe before querying so nothing committed in between is missed;
+        # duplicates are dropped by event id.
+        subscription = bus.subscribe(channels, last_id or 0)
+        backlog = load_backlog(subscription, last_id)
+        # Release the pooled connection before the long-lived stream starts.
+        db.session.remove()
+        response = forum_event_stream(bus, subscription, backlog)
+    except BaseException:
+        if subscription is not None:
+            bus.unsubscribe(subscription)
+        slots.release()
+        raise
+
+    # Runs when the server closes the body, even if it was never iterated.
+    def close():
+        bus.unsubscribe(subscription)
+        slots.release()
+
+    response.call_on_close(close)
+    return response
+
+@app.route('/forum/thread/<int:thread_id>/events')
+def forum_thread_events(thread_id):
+    thread = ForumThread.query.get_or_404(thread_id)
+
+    def load_backlog(subscription, last_id):
+        if last_id is None:
+            subscription.skip_to(db.session.query(db.func.max(ForumPost.id)).filter_by(thread_id=thread_id).scalar() or 0)
+            return []
+        # Resume: replay only the posts the browser has not seen yet.
+        posts = ForumPost.query.filter(ForumPost.thread_id == thread_id, ForumPost.id > last_id)\
+                              .options(joinedload(ForumPost.author))\
+                              .order_by(ForumPost.id)\
+                              .limit(app.config['FORUM_EVENTS_RESUME_LIMIT'])\
+                              .all()
+        return [{'id': p.id, 'type': 'reply', 'data': forum_post_event(thread, p, 'reply')} for p in posts]
+
+    return open_forum_stream([f'thread:{thread_id}'], load_backlog)
+
+@app.route('/forum/category/<int:category_id>/events')
+def forum_category_events(category_id):
+    ForumCategory.query.get_or_404(category_id)
+
+    def load_backlog(subscription, last_id):
+        if last_id is None:
+            subscription.skip_to(db.session.query(db.func.max(ForumPost.id)).scalar() or 0)
+            return []
+        rows = db.session.query(ForumPost, ForumThread)\
+                         .join(ForumThread, ForumPost.thread_id == ForumThread.id)\
+                         .filter(ForumThread.category_id == category_id, ForumPost.id > last_id)\
+                         .options(joinedload(ForumPost.author))\
+                         .order_by(ForumPost.id)\
+                         .limit(app.config['FORUM_EVENTS_RESUME_LIMIT'])\
+                         .all()
+        first_posts = dict(db.session.query(ForumPost.thread_id, db.func.min(ForumPost.id))
+                             .filter(ForumPost.thread_id.in_({t.id for _, t in rows}))
+                             .group_by(ForumPost.thread_id).all()) if rows else {}
+        backlog = []
+        for post, thread in rows:
+            kind = 'thread' if first_posts.get(thread.id) == post.id else 'reply'
+            backlog.append({'id': post.id, 'type': kind, 'data': forum_post_event(thread, post, kind)})
+        return backlog
+
+    return open_forum_stream([f'category:{category_id}'], load_backlog)
+
+# Forum archive
+FORUM_THREAD_COLUMNS = ['id', 'title', 'category_id', 'user_id', 'created_at', 'updated_at']
+FORUM_POST_COLUMNS = ['id', 'content', 'thread_id', 'user_id', 'created_at']
+
+def move_forum_threads(thread_ids, source_thread, source_post, target_thread, target_post, extra=None):
+    # Set-based copy of the threads and all their posts, then delete from the
+    # source; the caller commits so each batch is one transaction.
+    extra = extra or {}
+    thread_columns = [getattr(source_thread, c) for c in FORUM_THREAD_COLUMNS]
+    thread_columns += [db.literal(value, getattr(target_thread, name).type) for name, value in extra.items()]
+    db.session.execute(
+        db.insert(target_thread).from_select(
+            FORUM_THREAD_COLUMNS + list(extra),
+            db.select(*thread_columns).where(source_thread.id.in_(thread_ids))
+        )
+    )
+    moved_posts = db.session.execute(
+        db.insert(target_post).from_select(
+            FORUM_POST_COLUMNS,
+            db.select(*[getattr(source_post, c) for c in FORUM_POST_COLUMNS]).where(source_post.thread_id.in_(thread_ids))
+        )
+    ).rowcount
+    db.session.execute(db.delete(source_post).where(source_post.thread_id.in_(thread_ids)))
+    db.session.execute(db.delete(source_thread).where(source_thread.id.in_(thread_ids)))
+    return moved_posts
+
+def archive_forum_threads(older_than_days=None, batch_size=None):
+    if older_than_days is None:
+        older_than_days = app.config['FORUM_ARCHIVE_AFTER_DAYS']
+    if batch_size is None:
+        batch_size = app.config['FORUM_ARCHIVE_BATCH_SIZE']
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=older_than_days)
+    # SQLite hands out max(rowid) + 1 for new rows, so deleting the newest
+    # thread or post would let its id be reused and collide with the archive.
+    newest_thread_id = db.session.query(db.func.max(ForumThread.id)).scalar()
+    newest_post_thread_id = db.session.query(ForumPost.thread_id).order_by(ForumPost.id.desc()).limit(1).scalar()
+    protected = [i for i in (newest_thread_id, newest_post_thread_id) if i is not None]
+
+    threads_moved = posts_moved = 0
+    while True:
+        thread_ids = [row[0] for row in db.session.query(ForumThread.id)
+                                            .filter(ForumThread.updated_at < cutoff, ForumThread.id.notin_(protected))
+                                            .order_by(ForumThread.updated_at)
+                                            .limit(batch_size)
+                                            .all()]
+        if not thread_ids:
+            break
+        posts_moved += move_forum_threads(thread_ids, ForumThread, ForumPost, ArchivedForumThread, ArchivedForumPost,
+                                          extra={'archived_at': datetime.datetime.utcnow()})
+        db.session.commit()
+        threads_moved += len(thread_ids)
+    return threads_moved, posts_moved
+
+def restore_forum_thread(thread_id):
+    if db.session.get(ArchivedForumThread, thread_id) is None:
+        # Not archived, or restored by a concurrent request just now.
+        return db.session.get(ForumThread, thread_id)
+    try:
+        move_forum_threads([thread_id], ArchivedForumThread, ArchivedForumPost, ForumThread, ForumPost)
+        db.session.commit()
+    except IntegrityError:
+        # Another request restored the same thread first; use its copy.
+        db.session.rollback()
+    return db.session.get(ForumThread, thread_id)
+
+@app.cli.command('archive-forum')
+@click.option('--days', type=click.IntRange(min=0), default=None, help='Archive threads idle for this many days.')
+@click.option('--batch-size', type=click.IntRange(min=1), default=None, help='Threads moved per transaction.')
+def archive_forum_command(days, batch_size):
+    """Move inactive forum threads and their posts to the archive tables."""
+    threads_moved, posts_moved = archive_forum_threads(days, batch_size)
+    print(f"✅ Archived {threads_moved} threads and {posts_moved} posts")
+
+@app.route('/forum/archive')
+@rate_limit('heavy')
+def forum_archive():
+    query = request.args.get('q', '').strip()
+    threads = []
+    if query:
+        pattern = f'%{query}%'
+        matching_posts = db.session.query(ArchivedForumPost.thread_id).filter(ArchivedForumPost.content.ilike(pattern))
+        threads = ArchivedForumThread.query.options(joinedload(ArchivedForumThread.author),
+                                                    joinedload(ArchivedForumThread.category))\
+                                           .filter(db.or_(ArchivedForumThread.title.ilike(pattern),
+                                                          ArchivedForumThread.id.in_(matching_posts)))\
+                                           .order_by(ArchivedForumThread.updated_at.desc())\
+                                           .limit(50)\
+                                           .all()
+    return render_template('forum/archive.html', query=query, threads=threads)
+
 # Blog Routes with proper error handling and eager loading
 @app.route('/blog')
+@rate_limit('heavy')
 def blog():
     try:
         # Get category filter from request args
@@ -325,6 +986,7 @@ def blog_post(post_id):
     try:
         # Use eager loading to load author information
         post = BlogPost.query.options(joinedload(BlogPost.author)).get_or_404(post_id)
+        view_counter.increment('blog_post', post_id)
         return render_template('blog/post_detail.html', post=post)
     except Exception as e:
         print(f"Error in blog_post route: {e}")
@@ -370,15 +1032,18 @@ def create_blog_post():
 
 # Marketplace Routes with eager loading
 @app.route('/marketplace')
+@rate_limit('heavy')
 def marketplace():
     # Use eager loading for seller information
     products = Product.query.options(joinedload(Product.seller)).all()
     return render_template('marketplace/products.html', products=products)
 
 @app.route('/marketplace/product/<int:product_id>')
+@rate_limit('heavy')
 def product_detail(product_id):
     # Use eager loading for seller information
     product = Product.query.options(joinedload(Product.seller)).get_or_404(product_id)
+    view_counter.increment('product', product_id)
     all_products = Product.query.options(joinedload(Product.seller)).all()
     return render_template('marketplace/product_detail.html', product=product, products=all_products)
 
@@ -413,11 +1078,87 @@ def create_product():
         
         db.session.add(product)
         db.session.commit()
+        refresh_price_rollups_safely([product.category])
         flash('Product listed successfully!', 'success')
         return redirect(url_for('marketplace'))
     
     return render_template('marketplace/create_product.html')
 
+# Market price rollups
+UNCATEGORIZED = 'Uncategorized'
+PRICE_ROLLUP_COLUMNS = ['count', 'min_price', 'max_price', 'mean_price',
+                        'median_price', 'p25_price', 'p75_price', 'p90_price']
+
+def store_price_rollups(summaries):
+    if not summaries:
+        return
+    now = datetime.datetime.utcnow()
+    statement = sqlite_insert(PriceRollup).values([
+        dict(summary, category=category, day=now.date(), updated_at=now)
+        for category, summary in summaries.items()
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[PriceRollup.category, PriceRollup.day],
+        set_={name: statement.excluded[name] for name in PRICE_ROLLUP_COLUMNS + ['updated_at']}
+    )
+    db.session.execute(statement)
+    db.session.commit()
+
+def refresh_price_rollups(categories=None):
+    # Recompute today's rollup for the given categories, or for all of them.
+    # Only approved listings count towards market prices.
+    if categories is None:
+        rows = db.session.query(Product.category, Product.price)\
+                         .filter(Product.approved == True)\
+                         .order_by(Product.category, Product.price)\
+                         .all()
+        summaries = summarize_by_category((category or UNCATEGORIZED, price) for category, price in rows)
+        # Categories that have emptied out since the last rollup get a zero row.
+        today = datetime.datetime.utcnow().date()
+        for (category,) in db.session.query(PriceRollup.category).filter(PriceRollup.day == today):
+            summaries.setdefault(category, summarize_prices([]))
+    else:
+        summaries = {}
+        for category in set(c or UNCATEGORIZED for c in categories):
+            column_filter = Product.category.is_(None) if category == UNCATEGORIZED else Product.category == category
+            prices = [price for (price,) in db.session.query(Product.price)
+                                                      .filter(column_filter, Product.approved == True)
+                                                      .order_by(Product.price)]
+            summaries[category] = summarize_prices(prices)
+    store_price_rollups(summaries)
+    return summaries
+
+def refresh_price_rollups_safely(categories):
+    # Listing changes are already committed; a failed rollup must not turn
+    # them into an error page. The daily rollup-prices run catches up.
+    try:
+        refresh_price_rollups(categories)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Failed to refresh price rollups: {e}")
+
+@app.cli.command('rollup-prices')
+def rollup_prices_command():
+    """Recompute today's market price rollups for every category (run daily)."""
+    summaries = refresh_price_rollups()
+    print(f"✅ Price rollups updated for {len(summaries)} categories")
+
+@app.route('/api/prices')
+def api_prices():
+    # Reads only the rollup table; listings are never scanned here.
+    days = max(1, min(request.args.get('days', 30, type=int), 365))
+    since = datetime.datetime.utcnow().date() - datetime.timedelta(days=days - 1)
+    query = PriceRollup.query.filter(PriceRollup.day >= since)
+    category = request.args.get('category')
+    if category:
+        query = query.filter(PriceRollup.category == category)
+    categories = {}
+    for rollup in query.order_by(PriceRollup.category, PriceRollup.day).all():
+        categories.setdefault(rollup.category, []).append(rollup.to_dict())
+    response = jsonify(days=days, categories=categories)
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
+
 # Product Management Routes
 @app.route('/marketplace/my-products')
 @login_required
@@ -436,6 +1177,7 @@ def edit_product(product_id):
         return redirect(url_for('marketplace'))
     
     if request.method == 'POST':
+        old_category = product.category
         product.name = request.form.get('name')
         product.description = request.form.get('description')
         product.price = float(request.form.get('price'))
@@ -460,6 +1202,7 @@ def edit_product(product_id):
                 product.image_url = f"/{file_path}"
         
         db.session.commit()
+        refresh_price_rollups_safely([old_category, product.category])
         flash('Product updated successfully!', 'success')
         return redirect(url_for('product_detail', product_id=product.id))
     
@@ -482,8 +1225,10 @@ def delete_product(product_id):
         except:
             pass
     
+    category = product.category
     db.session.delete(product)
     db.session.commit()
+    refresh_price_rollups_safely([category])
     flash('Product deleted successfully!', 'success')
     return redirect(url_for('marketplace'))
 
@@ -501,17 +1246,102 @@ def admin_dashboard():
         'total_posts': BlogPost.query.count(),
         'total_threads': ForumThread.query.count(),
         'total_consultants': Consultant.query.count(),
-        'pending_approvals': BlogPost.query.filter_by(approved=False).count() + 
-                            Product.query.filter_by(approved=False).count() +
-                            Consultant.query.filter_by(approved=False).count()
+        'pending_approvals': sum(pending_counts().values())
     }
     
     recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
     
+    most_viewed_items = {
+        'Products': [(p.name, url_for('product_detail', product_id=p.id), views)
+                     for p, views in most_viewed('product', Product)],
+        'Blog Posts': [(p.title, url_for('blog_post', post_id=p.id), views)
+                       for p, views in most_viewed('blog_post', BlogPost)],
+        'Forum Threads': [(t.title, url_for('forum_thread', thread_id=t.id), views)
+                          for t, views in most_viewed('forum_thread', ForumThread)],
+    }
+    
     return render_template('admin/dashboard.html', 
                          stats=stats, 
                          recent_users=recent_users,
-                         users=User.query.all())
+                         most_viewed=most_viewed_items)
+
+# User administration: filtering, sorting and paging happen in SQL so the
+# page stays fast with a very large number of registered users.
+USER_SORT_COLUMNS = {
+    'username': User.username,
+    'email': User.email,
+    'joined': User.created_at,
+}
+USER_BULK_ACTIONS = {
+    'activate': ({'is_active': True}, 'activated'),
+    'deactivate': ({'is_active': False}, 'deactivated'),
+    'grant_consultant': ({'is_consultant': True}, 'granted the consultant role'),
+    'revoke_consultant': ({'is_consultant': False}, 'removed from the consultant role'),
+}
+USER_PROFESSION_ROLES = {'farmer': 'Farmer', 'student': 'Student', 'researcher': 'Researcher'}
+
+# SQLite's built-in lower() only folds ASCII letters; search terms are folded
+# the same way so that they compare against the indexed lower() values.
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def prefix_upper_bound(prefix):
+    # The smallest string above every string that starts with prefix, or None.
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    code = ord(prefix[-1]) + 1
+    if 0xD800 <= code <= 0xDFFF:
+        code = 0xE000  # surrogates cannot be encoded as UTF-8
+    return prefix[:-1] + chr(code)
+
+def prefix_filter(expression, prefix):
+    # A range on the indexed lower() expression; LIKE 'x%' cannot use it.
+    upper = prefix_upper_bound(prefix)
+    if upper is None:
+        return expression >= prefix
+    return db.and_(expression >= prefix, expression < upper)
+
+def filtered_users_query(args):
+    query = User.query
+    search = args.get('q', '').strip().translate(ASCII_LOWER)
+    if search:
+        query = query.filter(db.or_(prefix_filter(db.func.lower(User.username), search),
+                                    prefix_filter(db.func.lower(User.email), search)))
+    role = args.get('role')
+    if role == 'admin':
+        query = query.filter(User.is_admin == True)
+    elif role == 'consultant':
+        query = query.filter(User.is_consultant == True)
+    elif role in USER_PROFESSION_ROLES:
+        query = query.filter(User.profession == USER_PROFESSION_ROLES[role])
+    status = args.get('status')
+    if status in ('active', 'inactive'):
+        query = query.filter(User.is_active == (status == 'active'))
+    if args.get('expertise'):
+        query = query.filter(User.expertise_level == args['expertise'])
+
+    column = USER_SORT_COLUMNS.get(args.get('sort'), User.created_at)
+    order = column.asc() if args.get('dir') == 'asc' else column.desc()
+    return query.order_by(order, User.id.desc())
+
+def user_stats():
+    # One pass over the table instead of loading every user.
+    week_ago = datetime.datetime.utcnow() - datetime.timedelta(days=7)
+    count_if = lambda condition: db.func.coalesce(db.func.sum(db.case((condition, 1), else_=0)), 0)
+    row = db.session.query(
+        db.func.count(User.id),
+        count_if(User.is_active == True),
+        count_if(User.is_consultant == True),
+        count_if(User.profession == 'Farmer'),
+        count_if(User.is_admin == True),
+        count_if(User.created_at >= week_ago),
+    ).one()
+    return dict(zip(['total', 'active', 'consultants', 'farmers', 'admins', 'new_this_week'], row))
+
+def manage_users_return_url():
+    # Back to the same filtered page; only local user-admin URLs are accepted.
+    next_url = request.form.get('next', '')
+    return next_url if next_url.startswith(url_for('manage_users')) else url_for('manage_users')
 
 @app.route('/admin/users')
 @login_required
@@ -520,10 +1350,46 @@ def manage_users():
         flash('Access denied! Admin privileges required.', 'danger')
         return redirect(url_for('index'))
     
-    users = User.query.all()
-    return render_template('admin/manage_users.html', users=users)
+    pagination = filtered_users_query(request.args).paginate(
+        page=request.args.get('page', 1, type=int),
+        per_page=request.args.get('per_page', 25, type=int),
+        max_per_page=100,
+        error_out=False
+    )
+    filters = {key: request.args[key] for key in ('q', 'role', 'status', 'expertise', 'sort', 'dir', 'per_page')
+               if request.args.get(key)}
+    return render_template('admin/manage_users.html',
+                         users=pagination.items,
+                         pagination=pagination,
+                         filters=filters,
+                         stats=user_stats())
 
-@app.route('/admin/toggle_user/<int:user_id>')
+@app.route('/admin/users/bulk', methods=['POST'])
+@login_required
+def bulk_update_users():
+    if not current_user.is_admin:
+        flash('Access denied!', 'danger')
+        return redirect(url_for('index'))
+    
+    action = request.form.get('action')
+    user_ids = [int(i) for i in request.form.getlist('user_ids') if i.isdigit()]
+    back = redirect(manage_users_return_url())
+    if action not in USER_BULK_ACTIONS or not user_ids:
+        flash('Select at least one user and an action.', 'warning')
+        return back
+    
+    values, description = USER_BULK_ACTIONS[action]
+    query = User.query.filter(User.id.in_(user_ids))
+    if action == 'deactivate':
+        # Admins cannot lock themselves out.
+        query = query.filter(User.id != current_user.id)
+    # One set-based UPDATE for the whole selection.
+    updated = query.update(values, synchronize_session=False)
+    db.session.commit()
+    flash(f'{updated} users {description}.', 'success')
+    return back
+
+@app.route('/admin/toggle_user/<int:user_id>', methods=['POST'])
 @login_required
 def toggle_user_status(user_id):
     if not current_user.is_admin:
@@ -531,9 +1397,122 @@ def toggle_user_status(user_id):
         return redirect(url_for('index'))
     
     user = User.query.get_or_404(user_id)
-    # Here you would toggle user status (active/inactive)
-    flash(f'User {user.username} status updated!', 'success')
-    return redirect(url_for('manage_users'))
+    if user.id == current_user.id:
+        flash('You cannot deactivate your own account!', 'danger')
+        return redirect(url_for('manage_users'))
+    user.is_active = not user.is_active
+    db.session.commit()
+    flash(f'User {user.username} {"activated" if user.is_active else "deactivated"}!', 'success')
+    return redirect(manage_users_return_url())
+
+# Moderation queue
+# kind -> (model, column used as the item title)
+MODERATION_KINDS = {
+    'blog_post': (BlogPost, BlogPost.title),
+    'product': (Product, Product.name),
+    'consultant': (Consultant, Consultant.specialization),
+}
+
+def pending_counts():
+    # Each count is answered from the small partial index of unapproved rows.
+    return {kind: db.session.query(db.func.count(model.id)).filter(model.approved == False).scalar()
+            for kind, (model, _) in MODERATION_KINDS.items()}
+
+def pending_items_query(kinds):
+    selects = [
+        db.select(db.literal(kind).label('kind'), model.id.label('id'), title.label('title'),
+                  model.user_id.label('user_id'), model.created_at.label('created_at'))
+          .where(model.approved == False)
+        for kind, (model, title) in MODERATION_KINDS.items() if kind in kinds
+    ]
+    return db.union_all(*selects).subquery()
+
+def moderate_items(items, approve):
+    # items: {kind: [ids]}. Everything is applied in one transaction with one
+    # set-based statement per kind; only rows still pending are touched.
+    changed = {}
+    product_categories = set()
+    product_images = []
+    consultant_users = []
+    for kind, ids in items.items():
+        model, _ = MODERATION_KINDS[kind]
+        pending = db.and_(model.id.in_(ids), model.approved == False)
+        if kind == 'product':
+            rows = db.session.query(Product.category, Product.image_url).filter(pending).all()
+            product_categories.update(category for category, _ in rows)
+            product_images.extend(image for _, image in rows if image)
+        if kind == 'consultant' and not approve:
+            consultant_users = [user_id for (user_id,) in db.session.query(Consultant.user_id).filter(pending)]
+            db.session.execute(
+                db.delete(Review).where(Review.consultant_id.in_(db.select(Consultant.id).where(pending))),
+                execution_options={'synchronize_session': False})
+        if approve:
+            statement = db.update(model).where(pending).values(approved=True)
+        else:
+            statement = db.delete(model).where(pending)
+        changed[kind] = db.session.execute(statement, execution_options={'synchronize_session': False}).rowcount
+    if consultant_users:
+        User.query.filter(User.id.in_(consultant_users)).update({'is_consultant': False}, synchronize_session=False)
+    db.session.commit()
+
+    if not approve:
+        for image in product_images:
+            if os.path.exists(image.lstrip('/')):
+                try:
+                    os.remove(image.lstrip('/'))
+                except OSError:
+                    pass
+    if product_categories:
+        # Approving or rejecting listings changes which prices count.
+        refresh_price_rollups_safely(product_categories)
+    return changed
+
+@app.route('/admin/moderation')
+@login_required
+def moderation_queue():
+    if not current_user.is_admin:
+        flash('Access denied! Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+    
+    kind = request.args.get('kind')
+    kinds = [kind] if kind in MODERATION_KINDS else list(MODERATION_KINDS)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = 50
+    pending = pending_items_query(kinds)
+    # Oldest first, so nothing waits forever behind a spike of new items.
+    rows = db.session.query(pending).order_by(pending.c.created_at, pending.c.kind, pending.c.id)\
+                                    .limit(per_page + 1)\
+                                    .offset((page - 1) * per_page)\
+                                    .all()
+    users = {u.id: u for u in User.query.filter(User.id.in_({r.user_id for r in rows})).all()} if rows else {}
+    return render_template('admin/moderation.html',
+                         items=rows[:per_page],
+                         users=users,
+                         counts=pending_counts(),
+                         kind=kind if kind in MODERATION_KINDS else '',
+                         page=page,
+                         has_next=len(rows) > per_page)
+
+@app.route('/admin/moderation/batch', methods=['POST'])
+@login_required
+def moderate_batch():
+    if not current_user.is_admin:
+        flash('Access denied!', 'danger')
+        return redirect(url_for('index'))
+    
+    action = request.form.get('action')
+    items = {}
+    for value in request.form.getlist('items'):
+        kind, _, item_id = value.partition(':')
+        if kind in MODERATION_KINDS and item_id.isdigit():
+            items.setdefault(kind, []).append(int(item_id))
+    if action not in ('approve', 'reject') or not items:
+        flash('Select at least one item and an action.', 'warning')
+    else:
+        changed = moderate_items(items, approve=action == 'approve')
+        flash(f'{sum(changed.values())} items {"approved" if action == "approve" else "rejected"}.', 'success')
+    next_url = request.form.get('next', '')
+    return redirect(next_url if next_url.startswith(url_for('moderation_queue')) else url_for('moderation_queue'))
 
 @app.route('/admin/approve_blog/<int:post_id>')
 @login_required
@@ -542,9 +1521,8 @@ def approve_blog_post(post_id):
         flash('Access denied!', 'danger')
         return redirect(url_for('index'))
     
-    post = BlogPost.query.get_or_404(post_id)
-    post.approved = True
-    db.session.commit()
+    BlogPost.query.get_or_404(post_id)
+    moderate_items({'blog_post': [post_id]}, approve=True)
     flash('Blog post approved!', 'success')
     return redirect(url_for('admin_dashboard'))
 
@@ -555,9 +1533,8 @@ def approve_product(product_id):
         flash('Access denied!', 'danger')
         return redirect(url_for('index'))
     
-    product = Product.query.get_or_404(product_id)
-    product.approved = True
-    db.session.commit()
+    Product.query.get_or_404(product_id)
+    moderate_items({'product': [product_id]}, approve=True)
     flash('Product approved!', 'success')
     return redirect(url_for('admin_dashboard'))
 
@@ -568,12 +1545,48 @@ def approve_consultant(consultant_id):
         flash('Access denied!', 'danger')
         return redirect(url_for('index'))
     
-    consultant = Consultant.query.get_or_404(consultant_id)
-    consultant.approved = True
-    db.session.commit()
+    Consultant.query.get_or_404(consultant_id)
+    moderate_items({'consultant': [consultant_id]}, approve=True)
     flash('Consultant approved!', 'success')
     return redirect(url_for('admin_dashboard'))
 
+# Saved request profiles
+@app.route('/admin/profiles')
+@login_required
+def admin_profiles():
+    if not current_user.is_admin:
+        flash('Access denied! Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+
+    profiles = get_profile_store().files()
+    for profile in profiles:
+        profile['modified'] = datetime.datetime.fromtimestamp(profile['modified'])
+    return render_template('admin/profiles.html',
+                         profiles=profiles,
+                         enabled=app.config['PROFILING_ENABLED'],
+                         sample_rate=app.config['PROFILING_SAMPLE_RATE'])
+
+@app.route('/admin/profiles/<name>')
+@login_required
+def admin_profile_file(name):
+    if not current_user.is_admin:
+        flash('Access denied! Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+
+    store = get_profile_store()
+    if request.args.get('download') or not name.endswith('.pstats'):
+        return send_from_directory(store.directory, name, mimetype='text/plain',
+                                   as_attachment=bool(request.args.get('download')))
+    # pstats files are binary; show the usual report instead.
+    path = safe_join(store.directory, name)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    report = io.StringIO()
+    stats = pstats.Stats(path, stream=report)
+    sort = request.args.get('sort')
+    stats.sort_stats(sort if sort in ('cumulative', 'tottime', 'calls') else 'cumulative').print_stats(60)
+    return Response(report.getvalue(), mimetype='text/plain')
+
 # Profile Management Routes
 @app.route('/update_profile', methods=['POST'])
 @login_required
@@ -598,6 +1611,7 @@ def update_profile():
     return redirect(url_for('profile'))
 
 @app.route('/change_password', methods=['POST'])
+@rate_limit('auth')
 @login_required
 def change_password():
     current_password = request.form.get('current_password')
@@ -618,20 +1632,149 @@ def change_password():
     return redirect(url_for('profile'))
 
 # Consultancy Routes with eager loading
+CONSULTANT_SORTS = {
+    'rating': (Consultant.rating_score.desc(), Consultant.id.desc()),
+    'reviews': (Consultant.rating_count.desc(), Consultant.id.desc()),
+    'experience': (Consultant.experience.desc(), Consultant.id.desc()),
+    'newest': (Consultant.created_at.desc(), Consultant.id.desc()),
+}
+CONSULTANTS_PER_PAGE = 20
+REVIEWS_PER_PAGE = 10
+
 @app.route('/consultants')
+@rate_limit('heavy')
 def consultants():
-    # Use eager loading for user information
-    consultants = Consultant.query.options(joinedload(Consultant.user)).all()
-    return render_template('consultancy/consultants.html', consultants=consultants)
+    sort = request.args.get('sort', 'rating')
+    if sort not in CONSULTANT_SORTS:
+        sort = 'rating'
+    min_rating = request.args.get('min_rating', type=float)
+    page = request.args.get('page', 1, type=int)
+
+    # Ratings are stored on the consultant row, so ranking and filtering
+    # by rating is a walk of ix_consultant_rating rather than an aggregate.
+    query = Consultant.query.options(joinedload(Consultant.user))
+    if min_rating:
+        query = query.filter(Consultant.rating_score >= min_rating)
+    pagination = query.order_by(*CONSULTANT_SORTS[sort]).paginate(
+        page=page, per_page=CONSULTANTS_PER_PAGE, error_out=False)
+    featured = (Consultant.query.options(joinedload(Consultant.user))
+                .order_by(*CONSULTANT_SORTS['rating']).limit(3).all())
+    return render_template('consultancy/consultants.html',
+                         consultants=pagination.items,
+                         pagination=pagination,
+                         featured=featured,
+                         sort=sort,
+                         min_rating=min_rating)
 
 @app.route('/consultant/<int:consultant_id>')
+@rate_limit('heavy')
 def consultant_detail(consultant_id):
     # Use eager loading for user information
     consultant = Consultant.query.options(joinedload(Consultant.user)).get_or_404(consultant_id)
-    all_consultants = Consultant.query.options(joinedload(Consultant.user)).all()
+    page = request.args.get('page', 1, type=int)
+    reviews = (consultant.reviews.options(joinedload(Review.user))
+               .order_by(Review.created_at.desc(), Review.id.desc())
+               .paginate(page=page, per_page=REVIEWS_PER_PAGE, error_out=False))
+    # Star breakdown for this one consultant, read from its reviews index.
+    breakdown = dict(db.session.query(Review.rating, db.func.count(Review.id))
+                     .filter(Review.consultant_id == consultant.id)
+                     .group_by(Review.rating).all())
+    own_review = None
+    if current_user.is_authenticated:
+        own_review = Review.query.filter_by(consultant_id=consultant.id, user_id=current_user.id).first()
+    similar = (Consultant.query.options(joinedload(Consultant.user))
+               .filter(Consultant.id != consultant.id)
+               .order_by(*CONSULTANT_SORTS['rating']).limit(2).all())
     return render_template('consultancy/consultant_detail.html', 
                          consultant=consultant, 
-                         consultants=all_consultants)
+                         consultants=similar,
+                         reviews=reviews,
+                         breakdown=breakdown,
+                         own_review=own_review,
+                         now=datetime.datetime.utcnow)
+
+def apply_rating_change(consultant_id, count_delta, sum_delta):
+    # A single UPDATE computed from the stored values, so concurrent reviews
+    # of the same consultant cannot overwrite each other's counts. The caller
+    # commits it together with the review itself.
+    mean = app.config['CONSULTANT_RATING_PRIOR_MEAN']
+    weight = app.config['CONSULTANT_RATING_PRIOR_WEIGHT']
+    db.session.execute(
+        db.update(Consultant)
+          .where(Consultant.id == consultant_id)
+          .values(rating_count=Consultant.rating_count + count_delta,
+                  rating_sum=Consultant.rating_sum + sum_delta,
+                  rating_score=(weight * mean + Consultant.rating_sum + sum_delta)
+                               / (weight + Consultant.rating_count + count_delta)),
+        execution_options={'synchronize_session': False})
+
+@app.route('/consultant/<int:consultant_id>/review', methods=['POST'])
+@login_required
+def review_consultant(consultant_id):
+    consultant = Consultant.query.get_or_404(consultant_id)
+    if consultant.user_id == current_user.id:
+        flash('You cannot review yourself.', 'danger')
+        return redirect(url_for('consultant_detail', consultant_id=consultant_id))
+    rating = request.form.get('rating', type=int)
+    if rating not in range(1, 6):
+        flash('Please choose a rating from 1 to 5 stars.', 'danger')
+        return redirect(url_for('consultant_detail', consultant_id=consultant_id))
+    comment = (request.form.get('comment') or '').strip() or None
+    service_type = request.form.get('service_type') or None
+
+    try:
+        review = Review.query.filter_by(consultant_id=consultant_id, user_id=current_user.id).first()
+        if review is None:
+            db.session.add(Review(consultant_id=consultant_id, user_id=current_user.id,
+                                  rating=rating, comment=comment, service_type=service_type))
+            apply_rating_change(consultant_id, 1, rating)
+        else:
+            apply_rating_change(consultant_id, 0, rating - review.rating)
+            review.rating = rating
+            review.comment = comment
+            review.service_type = service_type
+            review.created_at = datetime.datetime.utcnow()
+        db.session.commit()
+        flash('Thank you for your review!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error saving review for consultant {consultant_id}: {e}")
+        flash('Your review could not be saved. Please try again.', 'danger')
+    return redirect(url_for('consultant_detail', consultant_id=consultant_id))
+
+@app.route('/review/<int:review_id>/delete', methods=['POST'])
+@login_required
+def delete_review(review_id):
+    review = Review.query.get_or_404(review_id)
+    if review.user_id != current_user.id and not current_user.is_admin:
+        flash('You can only delete your own reviews.', 'danger')
+        return redirect(url_for('consultant_detail', consultant_id=review.consultant_id))
+    consultant_id = review.consultant_id
+    # Only the transaction that actually removes the row adjusts the totals.
+    deleted = db.session.execute(db.delete(Review).where(Review.id == review_id),
+                                 execution_options={'synchronize_session': False}).rowcount
+    if deleted:
+        apply_rating_change(consultant_id, -1, -review.rating)
+    db.session.commit()
+    flash('Review deleted.', 'success')
+    return redirect(url_for('consultant_detail', consultant_id=consultant_id))
+
+@app.cli.command('recompute-ratings')
+def recompute_ratings_command():
+    """Rebuild every consultant's rating totals from its reviews."""
+    mean = app.config['CONSULTANT_RATING_PRIOR_MEAN']
+    weight = app.config['CONSULTANT_RATING_PRIOR_WEIGHT']
+    # Correlated subqueries, each answered from ix_review_consultant_created.
+    count = db.select(db.func.count(Review.id)).where(Review.consultant_id == Consultant.id).scalar_subquery()
+    total = db.select(db.func.sum(Review.rating)).where(Review.consultant_id == Consultant.id).scalar_subquery()
+    updated = db.session.execute(
+        db.update(Consultant).values(
+            rating_count=count,
+            rating_sum=db.func.coalesce(total, 0),
+            rating_score=(weight * mean + db.func.coalesce(total, 0)) / (weight + count)),
+        execution_options={'synchronize_session': False}).rowcount
+    db.session.commit()
+    print(f"✅ Ratings recomputed for {updated} consultants")
 
 @app.route('/become_consultant', methods=['GET', 'POST'])
 @login_required
@@ -659,6 +1802,244 @@ def become_consultant():
     
     return render_template('consultancy/become_consultant.html')
 
+# Worker lifecycle and health probes
+# Functions registered here run once per worker process before it takes
+# traffic, e.g. to load caches that would otherwise be filled by the first
+# unlucky request.
+warm_up_hooks = []
+worker_state = {'warmed': False, 'started_at': time.time()}
+
+def warm_up():
+    with app.app_context():
+        # Compile every template once so the first page view does not pay for it.
+        for name in app.jinja_env.list_templates(extensions=['html']):
+            try:
+                app.jinja_env.get_template(name)
+            except Exception as e:
+                app.logger.error(f"Failed to compile template {name}: {e}")
+        # Open a pooled database connection up front.
+        db.session.execute(db.text('SELECT 1'))
+        for hook in warm_up_hooks:
+            hook()
+        db.session.remove()
+    worker_state['warmed'] = True
+
+@app.route('/healthz')
+def healthz():
+    # Liveness only: a database outage is not fixed by restarting workers.
+    return jsonify(status='ok', pid=os.getpid(), uptime=round(time.time() - worker_state['started_at'], 1))
+
+@app.route('/readyz')
+def readyz():
+    checks = {'warmed': worker_state['warmed']}
+    try:
+        with db.engine.connect() as conn:
+            conn.execute(db.text('SELECT 1'))
+        checks['database'] = True
+    except Exception as e:
+        app.logger.error(f"Readiness check failed: {e}")
+        checks['database'] = False
+    ready = all(checks.values())
+    return jsonify(status='ready' if ready else 'unavailable', checks=checks), 200 if ready else 503
+
+# Offline support (service worker and web app manifest)
+# The service worker precaches everything under static/ plus these
+# third-party assets; the cache is versioned by a hash of all of them, so a
+# deploy that changes any asset makes browsers install a fresh worker.
+PWA_CDN_ASSETS = [
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js',
+    'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css',
+    'https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js',
+]
+pwa_assets = {}
+
+def static_asset_manifest():
+    # Hashing static/ once per process is cheap; file changes arrive with a
+    # deploy, which restarts the workers anyway.
+    if not pwa_assets:
+        digest = hashlib.sha256()
+        files = []
+        for root, dirs, names in os.walk(app.static_folder):
+            dirs.sort()
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, app.static_folder).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    digest.update(relative.encode() + b'\0' + f.read())
+                files.append(relative)
+        digest.update('\n'.join(PWA_CDN_ASSETS).encode())
+        pwa_assets.update(version=digest.hexdigest()[:16], files=files)
+    return pwa_assets
+
+warm_up_hooks.append(static_asset_manifest)
+
+@app.route('/pwa/assets.json')
+def pwa_assets_manifest():
+    assets = static_asset_manifest()
+    precache = [url_for('offline'), url_for('offline', queued=1)]
+    precache += [url_for('static', filename=name) for name in assets['files'] if name != 'sw.js']
+    response = jsonify(version=assets['version'], precache=precache, cdn=PWA_CDN_ASSETS)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/service-worker.js')
+def service_worker():
+    # Served from the site root rather than /static/ so that it may control
+    # every page; browsers re-check it on each visit because of no-cache.
+    with open(os.path.join(app.static_folder, 'sw.js'), encoding='utf-8') as f:
+        script = f.read().replace('__ASSET_VERSION__', static_asset_manifest()['version'])
+    response = Response(script, mimetype='application/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/manifest.webmanifest')
+def web_manifest():
+    manifest = {
+        'name': "AgriFarma - Farmers' Digital Hub",
+        'short_name': 'AgriFarma',
+        'start_url': url_for('index'),
+        'scope': '/',
+        'display': 'standalone',
+        'background_color': '#ffffff',
+        'theme_color': '#198754',
+        'icons': [{'src': url_for('static', filename='icons/icon.svg'), 'sizes': 'any', 'type': 'image/svg+xml'}],
+    }
+    return Response(json.dumps(manifest), mimetype='application/manifest+json')
+
+@app.route('/offline')
+def offline():
+    return render_template('offline.html', queued=request.args.get('queued') == '1')
+
+def create_schema():
+    # create_all() skips tables that already exist, so also create any
+    # columns and indexes added to existing models since the database was made.
+    with db.engine.connect() as conn:
+        # Only takes effect on a new, empty database; existing ones are
+        # converted with `flask vacuum-db --enable`.
+        conn.execute(db.text('PRAGMA auto_vacuum = INCREMENTAL'))
+    db.create_all()
+    # New columns must be nullable or have a server_default.
+    with db.engine.begin() as conn:
+        inspector = db.inspect(conn)
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column.type.compile(db.engine.dialect)}'
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    if not isinstance(default, str):
+                        default = str(default.compile(dialect=db.engine.dialect))
+                    else:
+                        default = "'" + default.replace("'", "''") + "'"
+                    ddl += f' NOT NULL DEFAULT {default}' if not column.nullable else f' DEFAULT {default}'
+                conn.execute(db.text(ddl))
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                # IF NOT EXISTS rather than checkfirst: SQLAlchemy cannot
+                # reflect expression indexes such as lower(username).
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create tables and sample data (run once before starting workers)."""
+    create_schema()
+    init_db()
+
+# SQLite maintenance
+# Meant to run from cron while the app is up, e.g. `flask backup-db` nightly
+# and `flask maintain-db` hourly; every step is safe alongside live traffic.
+def database_path():
+    return db.engine.url.database
+
+def backup_database(keep=None):
+    directory = app.config['BACKUP_DIR'] or os.path.join(app.instance_path, 'backups')
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    result = db_maintenance.backup(database_path(), os.path.join(directory, f'agrifarma-{stamp}.db'),
+                                   pages=app.config['BACKUP_PAGES_PER_STEP'],
+                                   sleep=app.config['BACKUP_STEP_SLEEP'])
+    result['pruned'] = db_maintenance.prune_backups(
+        directory, 'agrifarma-', app.config['BACKUP_KEEP'] if keep is None else keep,
+        current=os.path.basename(result['path']))
+    return result
+
+def report(action, result):
+    print(f"✅ {action}: {db_maintenance.format_bytes(result['bytes'])} in {result['duration']:.2f}s")
+
+@app.cli.command('backup-db')
+@click.option('--keep', type=click.IntRange(min=1), default=None, help='Number of newest backups to keep.')
+def backup_db_command(keep):
+    """Copy the live database to the backup directory."""
+    try:
+        result = backup_database(keep)
+    except (sqlite3.Error, db_maintenance.BackupRestarted) as e:
+        raise click.ClickException(f"Backup failed: {e}")
+    report(f"Backup written to {result['path']}", result)
+    print(f"   {result['pages']} pages in {result['steps']} steps, {result['restarts']} restarts, "
+          f"{len(result['pruned'])} old backups removed")
+
+@app.cli.command('vacuum-db')
+@click.option('--pages', type=int, default=None, help='Free pages to release (default: all).')
+@click.option('--enable', is_flag=True, help='Switch the database to incremental auto-vacuum first (one full VACUUM).')
+def vacuum_db_command(pages, enable):
+    """Return free pages in the database file to the filesystem."""
+    if enable:
+        result = db_maintenance.enable_incremental_vacuum(database_path())
+        if result['changed']:
+            report('Converted to incremental auto-vacuum', result)
+    try:
+        result = db_maintenance.incremental_vacuum(database_path(), pages)
+    except ValueError as e:
+        raise click.ClickException(f"{e}; run `flask vacuum-db --enable` once first")
+    report(f"Released {result['pages']} free pages", result)
+
+@app.cli.command('optimize-db')
+def optimize_db_command():
+    """Refresh stale query planner statistics (PRAGMA optimize)."""
+    report('Optimized', db_maintenance.optimize(database_path()))
+
+@app.cli.command('check-db')
+@click.option('--full', is_flag=True, help='Run the slower integrity_check, which also verifies indexes.')
+def check_db_command(full):
+    """Check the database file for corruption."""
+    result = db_maintenance.quick_check(database_path(), full=full)
+    if not result['ok']:
+        raise click.ClickException('Integrity problems found:\n' + '\n'.join(result['problems']))
+    report('Integrity check passed', result)
+
+@app.cli.command('maintain-db')
+def maintain_db_command():
+    """Scheduled upkeep: incremental vacuum, optimize and quick check."""
+    path = database_path()
+    try:
+        report('Vacuumed', db_maintenance.incremental_vacuum(path, app.config['VACUUM_PAGES_PER_RUN']))
+    except ValueError as e:
+        print(f"Skipped vacuum: {e}")
+    report('Optimized', db_maintenance.optimize(path))
+    result = db_maintenance.quick_check(path)
+    if not result['ok']:
+        raise click.ClickException('Integrity problems found:\n' + '\n'.join(result['problems']))
+    report('Quick check passed', result)
+
+@app.route('/admin/maintenance/backup', methods=['POST'])
+@rate_limit('heavy')
+@login_required
+def admin_backup():
+    if not current_user.is_admin:
+        flash('Access denied! Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+
+    try:
+        result = backup_database()
+        flash(f"Backup saved as {os.path.basename(result['path'])} "
+              f"({db_maintenance.format_bytes(result['bytes'])} in {result['duration']:.2f}s).", 'success')
+    except (sqlite3.Error, OSError, db_maintenance.BackupRestarted) as e:
+        app.logger.error(f"Database backup failed: {e}")
+        flash('Backup failed, the database was too busy. Please try again.', 'danger')
+    return redirect(url_for('admin_dashboard'))
+
 # Initialize database with sample data
 def init_db():
     # Create sample forum categories
@@ -740,8 +2121,9 @@ def init_db():
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        create_schema()
         init_db()
+    warm_up()
     print("🚀 AgriFarma is running! Access at: http://localhost:5000")
     print("👤 Admin Login: admin@agrifarma.com / admin123")
     print("👨‍🌾 Sample User: farmer@agrifarma.com / farmer123")
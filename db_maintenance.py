@@ -0,0 +1,150 @@
+"""Maintenance for the SQLite application database while the app is running.
+
+* ``backup`` copies the live database with SQLite's online backup API a few
+  pages at a time, sleeping between steps so that writers are never locked
+  out for long.  The copy is written to a temporary file and renamed into
+  place only once it is complete.
+* ``incremental_vacuum`` returns free pages to the filesystem a batch at a
+  time instead of rewriting the whole file like ``VACUUM`` does.  It needs
+  ``auto_vacuum=INCREMENTAL``, which ``enable_incremental_vacuum`` switches
+  on once (that conversion is a full VACUUM).
+* ``optimize`` refreshes the query planner statistics that have gone stale
+  and ``quick_check`` verifies the file's structure.
+
+Every function returns a small dict with the time taken and the number of
+bytes it processed so that the CLI can report it.
+"""
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+class BackupRestarted(Exception):
+    """The source kept changing under the backup and it had to start over."""
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def connect(path, timeout=30):
+    # Autocommit, so that PRAGMAs that cannot run inside a transaction work.
+    return sqlite3.connect(path, timeout=timeout, isolation_level=None)
+
+
+def backup(path, destination, pages=256, sleep=0.01, max_restarts=5):
+    """Copy ``path`` to ``destination`` online, ``pages`` pages per step.
+
+    A write to the source by another connection makes SQLite restart the
+    copy; after ``max_restarts`` restarts ``BackupRestarted`` is raised.
+    """
+    started = time.perf_counter()
+    partial = destination + '.partial'
+    progress = {'steps': 0, 'restarts': 0, 'remaining': None, 'total': 0}
+
+    def on_progress(status, remaining, total):
+        if progress['remaining'] is not None and remaining > progress['remaining']:
+            progress['restarts'] += 1
+            if progress['restarts'] > max_restarts:
+                raise BackupRestarted(f"backup restarted {progress['restarts']} times")
+        progress.update(steps=progress['steps'] + 1, remaining=remaining, total=total)
+
+    os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+    try:
+        with closing(connect(path)) as source, closing(sqlite3.connect(partial)) as target:
+            source.backup(target, pages=pages, progress=on_progress, sleep=sleep)
+            page_size = target.execute('PRAGMA page_size').fetchone()[0]
+            page_count = target.execute('PRAGMA page_count').fetchone()[0]
+        os.replace(partial, destination)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return {
+        'path': destination,
+        'duration': time.perf_counter() - started,
+        'bytes': page_size * page_count,
+        'pages': page_count,
+        'steps': progress['steps'],
+        'restarts': progress['restarts'],
+    }
+
+
+def prune_backups(directory, prefix, keep, current=None):
+    """Delete all but the newest ``keep`` backups; returns the removed names.
+
+    At least one backup is always kept, and ``current`` (the name of the one
+    just written) is never removed.
+    """
+    keep = max(keep, 1)
+    if current is not None:
+        keep -= 1
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith(prefix) and name.endswith('.db') and name != current)
+    removed = names[:max(len(names) - keep, 0)]
+    for name in removed:
+        os.remove(os.path.join(directory, name))
+    return removed
+
+
+def enable_incremental_vacuum(path):
+    """Switch the database to auto_vacuum=INCREMENTAL (a one-off full VACUUM)."""
+    started = time.perf_counter()
+    with closing(connect(path)) as conn:
+        mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        size_before = conn.execute('PRAGMA page_count').fetchone()[0] * conn.execute('PRAGMA page_size').fetchone()[0]
+        changed = mode != 2
+        if changed:
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+    return {'changed': changed, 'duration': time.perf_counter() - started, 'bytes': size_before}
+
+
+def incremental_vacuum(path, max_pages=None):
+    """Release up to ``max_pages`` free pages (all of them when None)."""
+    started = time.perf_counter()
+    with closing(connect(path)) as conn:
+        mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if mode != 2:
+            raise ValueError(f"auto_vacuum is {AUTO_VACUUM_MODES.get(mode, mode)}, not incremental")
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        # The pragma frees one page per step, and the sqlite3 module stops
+        # stepping statements without result columns after the first one;
+        # executescript() runs it to completion.
+        conn.executescript(f'PRAGMA incremental_vacuum({int(max_pages or 0)});')
+        after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    return {
+        'duration': time.perf_counter() - started,
+        'pages': before - after,
+        'bytes': (before - after) * page_size,
+        'remaining_free_bytes': after * page_size,
+    }
+
+
+def optimize(path, analysis_limit=1000):
+    """Run PRAGMA optimize, bounding how many rows ANALYZE may look at."""
+    started = time.perf_counter()
+    with closing(connect(path)) as conn:
+        conn.execute(f'PRAGMA analysis_limit = {int(analysis_limit)}')
+        conn.execute('PRAGMA optimize').fetchall()
+        size = conn.execute('PRAGMA page_count').fetchone()[0] * conn.execute('PRAGMA page_size').fetchone()[0]
+    return {'duration': time.perf_counter() - started, 'bytes': size}
+
+
+def quick_check(path, full=False, max_errors=20):
+    """Return ``{'ok': bool, 'problems': [...]}``; ``full`` also checks indexes."""
+    started = time.perf_counter()
+    pragma = 'integrity_check' if full else 'quick_check'
+    with closing(connect(path)) as conn:
+        rows = [row[0] for row in conn.execute(f'PRAGMA {pragma}({int(max_errors)})')]
+        size = conn.execute('PRAGMA page_count').fetchone()[0] * conn.execute('PRAGMA page_size').fetchone()[0]
+    ok = rows == ['ok']
+    return {'ok': ok, 'problems': [] if ok else rows,
+            'duration': time.perf_counter() - started, 'bytes': size}
@@ -0,0 +1,218 @@
+"""Publish/subscribe bus feeding the live forum Server-Sent Events streams.
+
+Routes publish a small JSON event after a reply or thread is committed and
+every open ``/forum/.../events`` connection subscribed to the matching
+channel (``thread:<id>`` or ``category:<id>``) receives it.  Event ids are
+forum post ids.  Posts commit in id order, but concurrent requests and other
+workers may publish them out of order, so each subscription remembers the
+ids it has delivered rather than only the highest one.  The SSE ``id:`` is
+the highest id delivered so far, so a reconnecting browser can resume from
+its ``Last-Event-ID`` by asking the database for newer posts.
+
+By default events only reach subscribers in the same process.  When the app
+runs with several worker processes, attach a ``SQLiteNotifier`` so that
+events are written to a small notification table and every worker polls it.
+"""
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import closing
+
+
+def format_sse(data=None, event=None, event_id=None, retry=None, comment=None):
+    """Serialise one Server-Sent Events frame."""
+    lines = []
+    if comment is not None:
+        lines.append(f": {comment}")
+    if retry is not None:
+        lines.append(f"retry: {int(retry)}")
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    if data is not None:
+        payload = data if isinstance(data, str) else json.dumps(data)
+        lines.extend(f"data: {line}" for line in payload.splitlines() or [''])
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """A single listener's queue of pending events."""
+
+    def __init__(self, channels, last_id=0, maxsize=100, remember=1000):
+        self.channels = frozenset(channels)
+        # Posts up to last_id are already on the page; newer ones are
+        # remembered one by one (the most recent ``remember`` of them).
+        self.last_id = last_id
+        self.newest_id = last_id
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._delivered = set()
+        self._order = deque()
+        self._remember = remember
+
+    def put(self, event):
+        # Never block the publisher on a slow client: mark the subscription
+        # as overflowed so the stream closes and the browser resumes from
+        # its Last-Event-ID against the database instead.
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def skip_to(self, event_id):
+        """Treat every event up to ``event_id`` as delivered already."""
+        self.last_id = self.newest_id = event_id
+
+    def accept(self, event_id):
+        """Record ``event_id`` as delivered; False when it already was."""
+        if event_id <= self.last_id or event_id in self._delivered:
+            return False
+        self._delivered.add(event_id)
+        self._order.append(event_id)
+        if len(self._order) > self._remember:
+            self._delivered.discard(self._order.popleft())
+        self.newest_id = max(self.newest_id, event_id)
+        return True
+
+    def get(self, timeout):
+        """Return the next unseen event, or None when ``timeout`` expires."""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                event = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            # The same post can arrive both from the resume query and the
+            # live bus (or twice through the notifier).
+            if self.accept(event['id']):
+                return event
+
+
+class ForumEventBus:
+    """Thread-safe fan-out of forum events to in-process subscribers."""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.notifier = None
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, channels, last_id=0):
+        subscription = Subscription(channels, last_id, self.queue_size)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                listeners = self._subscribers.get(channel)
+                if listeners is None:
+                    continue
+                listeners.discard(subscription)
+                if not listeners:
+                    del self._subscribers[channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({s for listeners in self._subscribers.values() for s in listeners})
+
+    def attach_notifier(self, notifier):
+        """Route publishes through ``notifier`` for cross-process fan-out."""
+        with self._lock:
+            if self.notifier is not None:
+                return self.notifier
+            self.notifier = notifier
+        notifier.start(self.dispatch)
+        return notifier
+
+    def publish(self, channels, event_id, event_type, data):
+        event = {'id': event_id, 'type': event_type, 'channels': list(channels), 'data': data}
+        if self.notifier is not None:
+            # The notifier hands the event back to ``dispatch`` in every
+            # worker, including this one.
+            self.notifier.notify(event)
+        else:
+            self.dispatch(event)
+
+    def dispatch(self, event):
+        with self._lock:
+            targets = set()
+            for channel in event['channels']:
+                targets.update(self._subscribers.get(channel, ()))
+        for subscription in targets:
+            subscription.put(event)
+
+
+class SQLiteNotifier:
+    """Cross-worker fan-out through a notification table in the app database.
+
+    Each publish is one small INSERT; a daemon thread per worker polls for
+    rows newer than the last one it saw and dispatches them locally.  Rows
+    older than ``retention`` seconds are pruned by whichever worker inserts.
+    """
+
+    TABLE = 'forum_event_log'
+
+    def __init__(self, database, poll_interval=1.0, retention=300):
+        self.database = database
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._thread = None
+        self._stop = threading.Event()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE} ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "payload TEXT NOT NULL, "
+                "created_at REAL NOT NULL)"
+            )
+            row = conn.execute(f"SELECT MAX(seq) FROM {self.TABLE}").fetchone()
+        self._last_seq = row[0] or 0
+
+    def _connect(self):
+        return sqlite3.connect(self.database, timeout=5)
+
+    def notify(self, event):
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                f"INSERT INTO {self.TABLE} (payload, created_at) VALUES (?, ?)",
+                (json.dumps(event), now),
+            )
+            conn.execute(f"DELETE FROM {self.TABLE} WHERE created_at < ?", (now - self.retention,))
+
+    def start(self, dispatch):
+        self._thread = threading.Thread(
+            target=self._run, args=(dispatch,), name='forum-event-notifier', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, dispatch):
+        conn = self._connect()
+        try:
+            while not self._stop.wait(self.poll_interval):
+                try:
+                    rows = conn.execute(
+                        f"SELECT seq, payload FROM {self.TABLE} WHERE seq > ? ORDER BY seq",
+                        (self._last_seq,),
+                    ).fetchall()
+                except sqlite3.OperationalError:
+                    # Database briefly locked by a writer; try next tick.
+                    continue
+                for seq, payload in rows:
+                    self._last_seq = seq
+                    dispatch(json.loads(payload))
+        finally:
+            conn.close()
@@ -0,0 +1,82 @@
+"""Gunicorn settings for running AgriFarma in production.
+
+Run locally with:
+
+    flask --app app init-db
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden from the environment, e.g.
+``WEB_CONCURRENCY=4 GUNICORN_REQUEST_THREADS=8 gunicorn -c gunicorn.conf.py wsgi:app``.
+
+* ``kill -HUP <master pid>`` starts fresh workers with the current code and
+  config, then gracefully stops the old ones once their requests finish.
+* Workers are recycled after ``max_requests`` (+ jitter) to cap memory growth.
+* Each worker warms up (templates, DB connection, cache hooks) before it is
+  handed any requests; ``/readyz`` reports 503 until then.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+
+# Pre-forked worker processes, each with a thread pool.  A gthread worker
+# keeps a thread busy for as long as a response body is being sent, so every
+# open live forum stream (Server-Sent Events) occupies one thread for up to
+# FORUM_EVENTS_MAX_STREAM seconds.  Each worker therefore gets
+# FORUM_EVENTS_MAX_STREAMS threads reserved for streams on top of the
+# threads that serve normal requests; the app refuses streams beyond that
+# with 503, so readers can never starve page views.
+#
+# Capacity is workers * FORUM_EVENTS_MAX_STREAMS open forum pages, 64 with the
+# defaults.  Raise FORUM_EVENTS_MAX_STREAMS for more concurrent readers; the
+# cost is one mostly idle thread (about 8 MB of reserved stack) per stream.
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+request_threads = int(os.environ.get('GUNICORN_REQUEST_THREADS', 4))
+stream_threads = int(os.environ.get('FORUM_EVENTS_MAX_STREAMS', 8))
+threads = request_threads + stream_threads
+worker_class = 'gthread'
+
+# Recycle workers to cap memory growth; jitter avoids restarting them all at once.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# The app is imported in each worker, not in the master, so SIGHUP picks up
+# new code and no database connections are inherited across fork().
+preload_app = False
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+# Tell the app how many stream slots its threads were sized for, and derive
+# its per-worker caps from the same numbers: at most one request per thread,
+# and expensive ("heavy") pages never take every request thread.  Requests
+# beyond the threads wait in gunicorn's queue, which no in-app cap can see;
+# put a proxy that sets X-Request-Start in front so the app sheds those by
+# queue time (ADMISSION_MAX_QUEUE_WAIT).
+raw_env = [
+    'FORUM_EVENTS_MAX_STREAMS=%d' % stream_threads,
+    'ADMISSION_MAX_CONCURRENT=%s' % os.environ.get('ADMISSION_MAX_CONCURRENT', threads),
+    'ADMISSION_MAX_HEAVY=%s' % os.environ.get('ADMISSION_MAX_HEAVY', max(request_threads - 1, 1)),
+]
+# Live forum events must reach subscribers connected to any worker.
+if workers > 1:
+    raw_env.append('FORUM_EVENTS_FANOUT=' + os.environ.get('FORUM_EVENTS_FANOUT', 'sqlite'))
+
+
+def post_worker_init(worker):
+    from app import warm_up
+
+    warm_up()
+    worker.log.info("Worker %s warmed up", worker.pid)
+
+
+def worker_exit(server, worker):
+    # Write buffered page views before the worker goes away.
+    from app import view_counter
+
+    view_counter.flush()
@@ -0,0 +1,48 @@
+"""Price statistics for the daily per-category market price rollups.
+
+The marketplace never computes these at request time: ``app.py`` stores one
+``PriceRollup`` row per (day, category) and refreshes today's row whenever a
+listing in that category changes.  Prices arrive already sorted by the
+database (from the ``(category, price)`` index), so every statistic here is a
+single pass or an O(1) lookup on the sorted list.
+"""
+from itertools import groupby
+
+PERCENTILES = (25, 50, 75, 90)
+
+
+def percentile(sorted_values, q):
+    """Linearly interpolated percentile ``q`` (0-100) of a sorted list."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = position - lower
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
+
+
+def summarize_prices(sorted_prices):
+    """Return the rollup columns for one category's sorted prices."""
+    if not sorted_prices:
+        return {'count': 0, 'min_price': None, 'max_price': None, 'mean_price': None,
+                'median_price': None, 'p25_price': None, 'p75_price': None, 'p90_price': None}
+    p25, median, p75, p90 = (percentile(sorted_prices, q) for q in PERCENTILES)
+    return {
+        'count': len(sorted_prices),
+        'min_price': sorted_prices[0],
+        'max_price': sorted_prices[-1],
+        'mean_price': sum(sorted_prices) / len(sorted_prices),
+        'median_price': median,
+        'p25_price': p25,
+        'p75_price': p75,
+        'p90_price': p90,
+    }
+
+
+def summarize_by_category(rows):
+    """Summarise ``(category, price)`` rows sorted by category, then price."""
+    return {
+        category: summarize_prices([price for _, price in group])
+        for category, group in groupby(rows, key=lambda row: row[0])
+    }
@@ -0,0 +1,172 @@
+"""On-demand CPU profiling of single requests.
+
+Two profilers are available.  ``cprofile`` traces every function call of the
+request thread and is saved as a ``.pstats`` file for ``pstats`` or
+snakeviz.  ``sampling`` has a background thread record the request thread's
+stack every few milliseconds.  It is saved as a ``.collapsed`` file, one
+``frame;frame;frame count`` line per distinct stack, which is the input
+format of flamegraph.pl and speedscope.  Sampling costs far less than tracing,
+so it is the one to use for long requests or for random sampling in
+production.
+
+``app.py`` only installs its request hooks when profiling is enabled, so a
+disabled profiler adds nothing to the request path.
+"""
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+MODES = ('sampling', 'cprofile')
+EXTENSIONS = {'sampling': '.collapsed', 'cprofile': '.pstats'}
+
+
+def frame_label(code):
+    # Semicolons separate frames and spaces end the stack in collapsed format.
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name}({filename}:{code.co_firstlineno})".replace(';', ':').replace(' ', '_')
+
+
+def format_collapsed(stacks):
+    """Serialise ``{(root, ..., leaf): samples}`` as collapsed stacks."""
+    return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+class SamplingProfiler:
+    """Samples one thread's stack from a background thread."""
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(format_collapsed(self.stacks))
+
+
+class TracingProfiler:
+    """cProfile for the calling thread."""
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def dump(self, path):
+        self._profile.dump_stats(path)
+
+
+class ProfileStore:
+    """A directory of saved profiles, oldest pruned beyond ``max_files``.
+
+    cProfile installs an interpreter-wide hook on recent Pythons, so only one
+    tracing capture runs at a time per process; concurrent sampling captures
+    are capped at ``max_sampling``.
+    """
+
+    def __init__(self, directory, max_files=200, max_sampling=2, sample_interval=0.005):
+        self.directory = directory
+        self.max_files = max_files
+        self.sample_interval = sample_interval
+        self._tracing = threading.Lock()
+        self._sampling = threading.BoundedSemaphore(max_sampling)
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self, mode):
+        """Start a capture; returns None when that profiler is busy."""
+        if mode == 'cprofile':
+            if not self._tracing.acquire(blocking=False):
+                return None
+            profiler, release = TracingProfiler(), self._tracing.release
+        else:
+            if not self._sampling.acquire(blocking=False):
+                return None
+            profiler, release = SamplingProfiler(self.sample_interval), self._sampling.release
+        try:
+            profiler.start()
+        except Exception:
+            release()
+            raise
+        return Capture(self, mode, profiler, release)
+
+    def files(self):
+        """Saved profiles, newest first."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(tuple(EXTENSIONS.values())):
+                    stat = entry.stat()
+                    entries.append({'name': entry.name, 'size': stat.st_size, 'modified': stat.st_mtime})
+        entries.sort(key=lambda e: (e['modified'], e['name']), reverse=True)
+        return entries
+
+    def prune(self):
+        for entry in self.files()[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.directory, entry['name']))
+            except OSError:
+                pass
+
+
+class Capture:
+    """One running profile of one request."""
+
+    def __init__(self, store, mode, profiler, release):
+        self.store = store
+        self.mode = mode
+        self.profiler = profiler
+        self._release = release
+        self._started = time.perf_counter()
+        self._stopped = False
+
+    def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self.duration = time.perf_counter() - self._started
+        try:
+            self.profiler.stop()
+        finally:
+            self._release()
+
+    def save(self, label):
+        """Stop profiling and write the file; returns its name."""
+        self.stop()
+        label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label)[:80] or 'request'
+        now = time.time()
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now)) + f"{now % 1:.3f}"[1:]
+        name = f"{stamp}-{os.getpid()}-{label}-{self.duration * 1000:.0f}ms{EXTENSIONS[self.mode]}"
+        self.profiler.dump(os.path.join(self.store.directory, name))
+        self.store.prune()
+        return name
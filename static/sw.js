@@ -0,0 +1,252 @@
+// sw.js - Offline support for AgriFarma
+// Served from /service-worker.js so that it controls the whole site; the
+// server replaces __ASSET_VERSION__ with a hash of static/, so any asset
+// change installs a new worker and a fresh precache.
+const ASSET_VERSION = '__ASSET_VERSION__';
+const SHELL_CACHE = `agrifarma-shell-${ASSET_VERSION}`;
+const PAGE_CACHE = 'agrifarma-pages';
+const QUEUE_DB = 'agrifarma-offline';
+const QUEUE_STORE = 'requests';
+const MAX_ATTEMPTS = 5;
+// How long a cached page waits for the network before it is shown instead
+const NETWORK_TIMEOUT = 3000;
+// Navigations this soon after a form post always wait for the network, so the
+// page after a post-redirect-get shows the change and its flash message
+const AFTER_POST_WINDOW = 10000;
+let lastPostAt = 0;
+
+// Pages kept for reading offline: fresh from the network when it answers within
+// NETWORK_TIMEOUT, otherwise the cached copy, refreshed in the background
+const CACHED_PAGES = [
+    /^\/blog\/\d+$/,
+    /^\/marketplace\/product\/\d+$/,
+    /^\/forum\/thread\/\d+$/
+];
+// Form posts that are saved while offline and sent once the connection returns
+const QUEUEABLE_POSTS = [
+    /^\/forum\/thread\/\d+\/reply$/,
+    /^\/marketplace\/create$/
+];
+// Never cached: live streams, APIs, admin pages and health probes
+const NETWORK_ONLY = [
+    /\/events$/,
+    /^\/api\//,
+    /^\/admin/,
+    /^\/healthz$/,
+    /^\/readyz$/,
+    /^\/pwa\//
+];
+const CDN_HOSTS = ['cdn.jsdelivr.net', 'cdnjs.cloudflare.com'];
+
+self.addEventListener('install', event => {
+    event.waitUntil((async () => {
+        const response = await fetch('/pwa/assets.json', { cache: 'no-store' });
+        const manifest = await response.json();
+        const cache = await caches.open(SHELL_CACHE);
+        await cache.addAll(manifest.precache);
+        // Third-party assets can only be cached as opaque responses.
+        await Promise.all(manifest.cdn.map(url =>
+            fetch(new Request(url, { mode: 'no-cors' }))
+                .then(res => cache.put(url, res))
+                .catch(() => null)
+        ));
+        await self.skipWaiting();
+    })());
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil((async () => {
+        const names = await caches.keys();
+        await Promise.all(names
+            .filter(name => name.startsWith('agrifarma-shell-') && name !== SHELL_CACHE)
+            .map(name => caches.delete(name)));
+        await self.clients.claim();
+        await replayQueue();
+    })());
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+
+    if (url.origin !== self.location.origin) {
+        if (request.method === 'GET' && CDN_HOSTS.includes(url.hostname)) {
+            event.respondWith(cacheFirst(request, SHELL_CACHE));
+        }
+        return;
+    }
+    if (request.method === 'POST') {
+        lastPostAt = Date.now();
+        if (QUEUEABLE_POSTS.some(pattern => pattern.test(url.pathname))) {
+            event.respondWith(postOrQueue(request));
+        }
+        return;
+    }
+    if (request.method !== 'GET' || NETWORK_ONLY.some(pattern => pattern.test(url.pathname))) {
+        return;
+    }
+    if (url.pathname === '/logout') {
+        // Cached pages include the signed-in user's details.
+        event.waitUntil(caches.delete(PAGE_CACHE));
+        return;
+    }
+    if (url.pathname.startsWith('/static/')) {
+        event.respondWith(cacheFirst(request, SHELL_CACHE));
+    } else if (CACHED_PAGES.some(pattern => pattern.test(url.pathname))) {
+        event.respondWith(networkOrCached(event, request));
+    } else if (request.mode === 'navigate') {
+        event.respondWith(networkFirst(request));
+    }
+});
+
+self.addEventListener('sync', event => {
+    if (event.tag === 'agrifarma-replay') {
+        event.waitUntil(replayQueue());
+    }
+});
+
+self.addEventListener('message', event => {
+    if (event.data === 'replay') {
+        event.waitUntil(replayQueue());
+    }
+});
+
+async function cacheFirst(request, cacheName) {
+    const cached = await caches.match(request);
+    if (cached) {
+        return cached;
+    }
+    const response = await fetch(request);
+    if (response.ok || response.type === 'opaque') {
+        const cache = await caches.open(cacheName);
+        cache.put(request, response.clone());
+    }
+    return response;
+}
+
+async function networkOrCached(event, request) {
+    const cache = await caches.open(PAGE_CACHE);
+    const network = fetch(request).then(response => {
+        if (response.ok) {
+            cache.put(request, response.clone());
+        }
+        return response;
+    });
+    const cached = await cache.match(request);
+    if (!cached) {
+        return network.catch(() => offlinePage());
+    }
+    if (Date.now() - lastPostAt < AFTER_POST_WINDOW) {
+        return network.catch(() => cached);
+    }
+    // Slow or failed network: show the saved copy and let the refresh finish.
+    event.waitUntil(network.catch(() => null));
+    const timeout = new Promise(resolve => setTimeout(() => resolve(cached), NETWORK_TIMEOUT));
+    return Promise.race([network.catch(() => cached), timeout]);
+}
+
+async function networkFirst(request) {
+    try {
+        const response = await fetch(request);
+        if (response.ok) {
+            const cache = await caches.open(PAGE_CACHE);
+            cache.put(request, response.clone());
+        }
+        return response;
+    } catch (error) {
+        return (await caches.match(request)) || offlinePage();
+    }
+}
+
+async function offlinePage(queued) {
+    // Both variants are precached; a redirect would need the network.
+    const url = queued ? '/offline?queued=1' : '/offline';
+    return (await caches.match(url)) || Response.redirect(url, 303);
+}
+
+// Offline queue (IndexedDB)
+
+function openQueue() {
+    return new Promise((resolve, reject) => {
+        const open = indexedDB.open(QUEUE_DB, 1);
+        open.onupgradeneeded = () => open.result.createObjectStore(QUEUE_STORE, { keyPath: 'id', autoIncrement: true });
+        open.onsuccess = () => resolve(open.result);
+        open.onerror = () => reject(open.error);
+    });
+}
+
+async function withStore(mode, callback) {
+    const db = await openQueue();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(QUEUE_STORE, mode);
+        const result = callback(tx.objectStore(QUEUE_STORE));
+        tx.oncomplete = () => resolve(result && result.result !== undefined ? result.result : result);
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+async function postOrQueue(request) {
+    const copy = request.clone();
+    try {
+        return await fetch(request);
+    } catch (error) {
+        // Files (product photos) are stored as Blobs alongside the text fields.
+        const form = await copy.formData();
+        await withStore('readwrite', store => store.add({
+            url: copy.url,
+            entries: Array.from(form.entries()),
+            queuedAt: Date.now(),
+            attempts: 0
+        }));
+        if (self.registration.sync) {
+            self.registration.sync.register('agrifarma-replay').catch(() => null);
+        }
+        await notifyClients({ type: 'queued', url: copy.url });
+        return offlinePage(true);
+    }
+}
+
+// activate, sync and the page's 'online' message often arrive together; they
+// share one run so that no queued post is sent twice.
+let replaying = null;
+
+function replayQueue() {
+    if (!replaying) {
+        replaying = sendQueued().finally(() => { replaying = null; });
+    }
+    return replaying;
+}
+
+async function sendQueued() {
+    const records = await withStore('readonly', store => store.getAll());
+    let sent = 0;
+    for (const record of records || []) {
+        const body = new FormData();
+        record.entries.forEach(([name, value]) => body.append(name, value));
+        let response;
+        try {
+            response = await fetch(record.url, { method: 'POST', body: body, credentials: 'same-origin' });
+        } catch (error) {
+            return; // Still offline; try again on the next sync or 'online' event.
+        }
+        const needsLogin = response.url && new URL(response.url).pathname === '/login';
+        if (response.ok && !needsLogin) {
+            await withStore('readwrite', store => store.delete(record.id));
+            sent++;
+        } else if (record.attempts + 1 >= MAX_ATTEMPTS) {
+            await withStore('readwrite', store => store.delete(record.id));
+            await notifyClients({ type: 'failed', url: record.url });
+        } else {
+            record.attempts++;
+            await withStore('readwrite', store => store.put(record));
+        }
+    }
+    if (sent) {
+        await notifyClients({ type: 'sent', count: sent });
+    }
+}
+
+async function notifyClients(message) {
+    const clients = await self.clients.matchAll({ includeUncontrolled: true });
+    clients.forEach(client => client.postMessage(message));
+}
@@ -0,0 +1,83 @@
+"""Write-behind buffer for page view counters.
+
+Counting a view with an UPDATE per request would make every reader wait for
+SQLite's single write lock.  Instead views are added to an in-memory buffer
+and a background thread flushes the per-entity totals in one batched upsert
+every ``interval`` seconds, or sooner once ``max_events`` views are pending.
+At most one flush window of views is lost if the process dies abruptly;
+``flush()`` is also called at interpreter exit and on worker shutdown.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounterBuffer:
+
+    def __init__(self, flush_fn, interval=10, max_events=500, max_pending=100000):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_events = max_events
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = Counter()
+        self._events = 0
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def increment(self, entity_type, entity_id, count=1):
+        with self._lock:
+            self._pending[(entity_type, entity_id)] += count
+            self._events += count
+            full = self._events >= self.max_events
+        self._ensure_started()
+        if full:
+            self._wakeup.set()
+
+    def _ensure_started(self):
+        # Threads do not survive fork(), so each worker starts its own.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='view-counter-flush', daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Counts were put back by flush(); retry on the next tick.
+                logger.exception("Failed to flush view counters")
+
+    def flush(self):
+        """Write all pending increments; returns the number of rows upserted."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+                self._events = 0
+            if not pending:
+                return 0
+            try:
+                self.flush_fn([(t, i, n) for (t, i), n in pending.items()])
+            except Exception:
+                with self._lock:
+                    # Keep the counts for the next attempt unless the
+                    # buffer has grown past its bound while we failed.
+                    if len(self._pending) + len(pending) <= self.max_pending:
+                        self._pending.update(pending)
+                        self._events += sum(pending.values())
+                raise
+            return len(pending)
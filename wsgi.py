@@ -0,0 +1,10 @@
+"""WSGI entry point for production servers.
+
+    flask --app app init-db
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+See gunicorn.conf.py for worker, recycling and reload settings.
+"""
+from app import app
+
+application = app